@@ -0,0 +1,186 @@
+#author Karim Ulmann
+
+""" An asyncio front-end for catalogue queries. """
+
+import asyncio
+import functools
+
+from movieLib import MOVIES, MovieLib, build_library
+
+
+class AsyncCatalogue:
+    """ Serves catalogue queries from an asyncio event loop.
+
+    Queries are not run straight away: each one joins a batch that is
+    answered at the end of the current pass of the event loop.  Identical
+    queries in a batch share one answer, and all the title lookups in a
+    batch are made together (see MovieLib.lookup_many).
+
+    reload() rebuilds the library in an executor thread and swaps it in
+    when it is ready, so queries keep being answered from the old library
+    meanwhile and the loop is never blocked by a rebuild.
+    """
+
+    def __init__(self, library=None, executor=None):
+        """ Initialise the front-end.
+
+        Args:
+            library - the MovieLib to query; by default an empty one, to be
+                filled by reload()
+            executor - the concurrent.futures executor for rebuilds, or
+                None for the loop's default executor
+        """
+        if library is None:
+            library = MovieLib()
+        self._library = library
+        self._executor = executor
+        self._lookups = {}   # title -> future, for the current batch
+        self._queries = {}   # (method, args) -> future, for the current batch
+        self._scheduled = False
+
+    def library(self):
+        """ Return the library currently being queried. """
+        return self._library
+
+    async def lookup(self, title):
+        """ Return the Movie with matching title, or None. """
+        future = self._lookups.get(title)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._lookups[title] = future
+            self._schedule()
+        # shielded, as the future is shared: one caller giving up (say, on
+        # a timeout) must not cancel it for the others
+        return await asyncio.shield(future)
+
+    async def search(self, title):
+        """ Return the full description of the movie with matching title,
+        or None.
+        """
+        movie = await self.lookup(title)
+        if movie is None:
+            return None
+        return movie.full_str()
+
+    async def range(self, lo=None, hi=None):
+        """ Return a list of the movies with lo <= title < hi, in order. """
+        return await self._query('range', lo, hi)
+
+    async def prefix(self, start):
+        """ Return a list of the movies whose title starts with start. """
+        return await self._query('prefix', start)
+
+    async def page(self, offset, limit):
+        """ Return a list of the movies with up to limit titles from
+        position offset (see MovieLib.page).
+        """
+        return await self._query('page', offset, limit)
+
+    async def released_between(self, first=None, last=None):
+        """ Return a list of the movies released from first to last. """
+        return await self._query('released_between', first, last)
+
+    async def runtime_between(self, shortest=None, longest=None):
+        """ Return a list of the movies from shortest to longest minutes
+        long.
+        """
+        return await self._query('runtime_between', shortest, longest)
+
+    async def _query(self, method, *args):
+        """ Join (or start) the batch's answer to library.method(*args). """
+        future = self._queries.get((method, args))
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._queries[(method, args)] = future
+            self._schedule()
+        return await asyncio.shield(future)
+
+    def _schedule(self):
+        """ Arrange for the current batch to be answered this loop pass. """
+        if not self._scheduled:
+            self._scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self):
+        """ Answer every query in the current batch. """
+        lookups = self._lookups
+        queries = self._queries
+        self._lookups = {}
+        self._queries = {}
+        self._scheduled = False
+        library = self._library
+        if lookups:
+            try:
+                found = library.lookup_many(lookups)
+            except Exception as error:
+                for future in lookups.values():
+                    _settle(future, exception=error)
+            else:
+                for title, future in lookups.items():
+                    _settle(future, found[title])
+        for (method, args), future in queries.items():
+            try:
+                result = list(getattr(library, method)(*args))
+            except Exception as error:
+                _settle(future, exception=error)
+            else:
+                _settle(future, result)
+
+    async def reload(self, filename=MOVIES, **options):
+        """ Rebuild the library from filename in the executor, then switch
+        queries over to it; return the new library.
+
+        options are passed on to build_library (e.g. balanced=True).
+        """
+        loop = asyncio.get_running_loop()
+        build = functools.partial(build_library, filename, bulk=True,
+                                  verbose=False, **options)
+        library = await loop.run_in_executor(self._executor, build)
+        self._library = library
+        return library
+
+    def _test():
+        async def run():
+            catalogue = AsyncCatalogue()
+            await catalogue.reload()
+            titles = ['Star Wars', 'Memento', 'Star Wars', 'No Such Movie']
+            results = await asyncio.gather(
+                *[catalogue.search(title) for title in titles],
+                catalogue.prefix('Wonder W'), catalogue.prefix('Wonder W'))
+            for result in results:
+                print(result if not isinstance(result, list)
+                      else [str(movie) for movie in result])
+
+            # queries keep being answered while a reload runs
+            reload = asyncio.ensure_future(catalogue.reload(balanced=True))
+            answered = 0
+            while not reload.done():
+                await catalogue.lookup('Memento')
+                answered += 1
+            print('answered', answered, 'lookups during the reload;',
+                  catalogue.library().bst._stats())
+
+            # one of two callers sharing a lookup gives up on it
+            first = asyncio.ensure_future(catalogue.lookup('Alien'))
+            second = asyncio.ensure_future(catalogue.lookup('Alien'))
+            await asyncio.sleep(0)
+            first.cancel()
+            results = await asyncio.gather(first, second,
+                                           return_exceptions=True)
+            print('cancelled:', isinstance(results[0], asyncio.CancelledError),
+                  '; the other still answered:', results[1])
+        asyncio.run(run())
+
+
+def _settle(future, result=None, exception=None):
+    """ Complete future, unless it is already done. """
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+if __name__ == '__main__':
+    AsyncCatalogue._test()
@@ -0,0 +1,487 @@
+#author Karim Ulmann
+
+from array import array
+
+from walks import TreeWalks
+
+
+NIL = 0  # index of the sentinel standing in for an empty subtree
+
+
+class ArrayBST(TreeWalks):
+    """ A Binary Search Tree held in parallel arrays instead of linked nodes.
+
+    Slot i describes one node: _left[i], _right[i] and _parent[i] are the
+    slot numbers of its children and parent (NIL if none), _size[i] and
+    _height[i] describe the subtree rooted there, _keys[i] is the sort_key()
+    of its item and _items[i] the item itself.  Slot 0 is a sentinel with
+    size 0 and height -1, so empty subtrees need no special cases.  Slots
+    freed by removals are reused by later adds.
+
+    The links and metadata live in array('i') buffers, so there is no
+    per-node object for the garbage collector to track, and a tree can be
+    copied (or pickled) buffer by buffer.
+
+    An ArrayBST stands for a whole tree, but it offers the same methods as
+    the BSTNode at the root of one, so MovieLib can use either.
+    """
+
+    def __init__(self, item):
+        """ Initialise a tree on creation, holding just item. """
+        self._left = array('i', [NIL, NIL])
+        self._right = array('i', [NIL, NIL])
+        self._parent = array('i', [NIL, NIL])
+        self._size = array('i', [0, 1])
+        self._height = array('i', [-1, 0])
+        self._keys = [None, item.sort_key()]
+        self._items = [None, item]
+        self._free = []
+        self._rootindex = 1
+
+    @classmethod
+    def from_sorted(cls, items):
+        """ Return a height-optimal tree holding items, or None if empty.
+
+        Args:
+            items: a list of objects in strictly increasing order (sorted and
+                with no duplicates); it is not checked
+
+        Item j goes in slot j + 1, so the slots are in order, and the links
+        are filled in directly in O(n) with no comparisons.
+        """
+        n = len(items)
+        if n == 0:
+            return None
+        tree = cls.__new__(cls)
+        tree._left = array('i', bytes(4 * (n + 1)))
+        tree._right = array('i', bytes(4 * (n + 1)))
+        tree._parent = array('i', bytes(4 * (n + 1)))
+        tree._size = array('i', bytes(4 * (n + 1)))
+        tree._height = array('i', bytes(4 * (n + 1)))
+        tree._height[NIL] = -1
+        tree._keys = [None] + [item.sort_key() for item in items]
+        tree._items = [None] + list(items)
+        tree._free = []
+        tree._rootindex = tree._build(1, n + 1, NIL)
+        return tree
+
+    def _build(self, lo, hi, parent):
+        """ Link slots lo to hi-1 into a balanced subtree; return its root. """
+        if lo >= hi:
+            return NIL
+        mid = (lo + hi) // 2
+        self._parent[mid] = parent
+        left = self._build(lo, mid, mid)
+        right = self._build(mid + 1, hi, mid)
+        self._left[mid] = left
+        self._right[mid] = right
+        self._size[mid] = hi - lo
+        self._height[mid] = 1 + max(self._height[left], self._height[right])
+        return mid
+
+    def copy(self):
+        """ Return an independent copy of this tree (the items are shared). """
+        tree = self.__class__.__new__(self.__class__)
+        tree._left = array('i', self._left)
+        tree._right = array('i', self._right)
+        tree._parent = array('i', self._parent)
+        tree._size = array('i', self._size)
+        tree._height = array('i', self._height)
+        tree._keys = list(self._keys)
+        tree._items = list(self._items)
+        tree._free = list(self._free)
+        tree._rootindex = self._rootindex
+        return tree
+
+    def root(self):
+        """ Return the tree itself (it is its own root). """
+        return self
+
+    def size(self):
+        """ Return the number of items in the tree. """
+        return self._size[self._rootindex]
+
+    def height(self):
+        """ Return the height of the tree. """
+        return self._height[self._rootindex]
+
+    def _walk(self):
+        """ Return the accessors TreeWalks needs to walk the slots. """
+        return (self._rootindex, NIL, self._left.__getitem__,
+                self._right.__getitem__, self._keys.__getitem__,
+                self._items.__getitem__, self._size.__getitem__)
+
+    def find_node(self, key):
+        """ Return the slot whose item has sort_key() == key, or None. """
+        left = self._left
+        right = self._right
+        keys = self._keys
+        i = self._rootindex
+        while i != NIL:
+            curkey = keys[i]
+            if curkey > key:
+                i = left[i]
+            elif curkey < key:
+                i = right[i]
+            else:
+                return i
+        return None
+
+    def search_node(self, searchitem):
+        """ Return the slot holding the object matching searchitem, or None. """
+        return self.find_node(searchitem.sort_key())
+
+    def find(self, key):
+        """ Return the item whose sort_key() == key, or None. """
+        i = self.find_node(key)
+        if i is None:
+            return None
+        return self._items[i]
+
+    def search(self, searchitem):
+        """ Return the full string of the object matching searchitem, or None. """
+        item = self.find(searchitem.sort_key())
+        if item is None:
+            return None
+        return item.full_str()
+
+    def add(self, obj):
+        """ Add item to the tree, maintaining BST properties.
+
+        Returns the item added, or None if a matching object was already there.
+        """
+        key = obj.sort_key()
+        left = self._left
+        right = self._right
+        keys = self._keys
+        parent = NIL
+        i = self._rootindex
+        while i != NIL:
+            parent = i
+            if key < keys[i]:
+                i = left[i]
+            elif key > keys[i]:
+                i = right[i]
+            else:
+                return None
+        i = self._newslot(obj, key, parent)
+        if parent == NIL:
+            self._rootindex = i
+        elif key < keys[parent]:
+            left[parent] = i
+        else:
+            right[parent] = i
+        self._retrace(parent)
+        return obj
+
+    def _newslot(self, item, key, parent):
+        """ Return a free slot (reused or appended) set up as a leaf. """
+        if self._free:
+            i = self._free.pop()
+            self._keys[i] = key
+            self._items[i] = item
+        else:
+            i = len(self._items)
+            self._left.append(NIL)
+            self._right.append(NIL)
+            self._parent.append(NIL)
+            self._size.append(0)
+            self._height.append(0)
+            self._keys.append(key)
+            self._items.append(item)
+        self._left[i] = NIL
+        self._right[i] = NIL
+        self._parent[i] = parent
+        self._size[i] = 1
+        self._height[i] = 0
+        return i
+
+    def remove(self, searchitem):
+        """ Remove and return the object matching searchitem, if there. """
+        i = self.find_node(searchitem.sort_key())
+        if i is None:
+            return None
+        return self.remove_node(i)
+
+    def delete(self, key):
+        """ Remove the item whose sort_key() == key.
+
+        Returns (root, item) as BSTNode.delete does: the tree itself, or
+        None if it is now empty, and the item removed (or None).
+        """
+        i = self.find_node(key)
+        if i is None:
+            return self, None
+        item = self.remove_node(i)
+        if self._rootindex == NIL:
+            return None, item
+        return self, item
+
+    def split(self, key):
+        """ Return (left, right), trees of the items whose sort_key() is
+        before key and of the rest (None if empty), as BSTNode.split does.
+
+        The arrays cannot be shared, so both trees are rebuilt: this costs
+        O(n), and leaves this tree as it was.
+        """
+        items = list(self)
+        i = self.rank(key)
+        return self.from_sorted(items[:i]), self.from_sorted(items[i:])
+
+    @classmethod
+    def join(cls, left, right):
+        """ Return a tree holding the items of the trees left and right
+        (either may be None), whose items must all be before those of
+        right; it is not checked.  The tree is rebuilt, in O(n).
+        """
+        if left is None:
+            return right
+        if right is None:
+            return left
+        return cls.from_sorted(list(left) + list(right))
+
+    def remove_range(self, lo=None, hi=None):
+        """ Remove the items whose sort_key() k has lo <= k < hi.
+
+        Either bound may be None to leave that end open.  Returns (root,
+        removed) as BSTNode.remove_range does: the tree of the items left
+        (None if empty) and a tree of the items removed (or None).  Both
+        are rebuilt, in O(n).
+        """
+        items = list(self)
+        i = 0 if lo is None else self.rank(lo)
+        j = len(items) if hi is None else max(i, self.rank(hi))
+        return (self.from_sorted(items[:i] + items[j:]),
+                self.from_sorted(items[i:j]))
+
+    def replace(self, obj):
+        """ Put obj in place of the item with the same sort_key(), and return
+        that item (or None, leaving the tree alone, if there is none).
+        """
+        i = self.find_node(obj.sort_key())
+        if i is None:
+            return None
+        old = self._items[i]
+        self._items[i] = obj
+        return old
+
+    def remove_node(self, i):
+        """ Remove the item in slot i from the tree, and return it.
+
+        Maintains the BST properties.  If slot i is full, the item of its
+        predecessor is moved into it and the predecessor's slot is unlinked
+        instead; the unlinked slot has at most one child, which takes its
+        place.
+        """
+        element = self._items[i]
+        left = self._left
+        right = self._right
+        if left[i] != NIL and right[i] != NIL:
+            pred = left[i]
+            while right[pred] != NIL:
+                pred = right[pred]
+            self._items[i] = self._items[pred]
+            self._keys[i] = self._keys[pred]
+            i = pred
+        child = left[i]
+        if child == NIL:
+            child = right[i]
+        parent = self._parent[i]
+        self._replace_in_parent(i, child)
+        self._items[i] = None
+        self._keys[i] = None
+        self._free.append(i)
+        self._retrace(parent)
+        return element
+
+    def _replace_in_parent(self, i, new):
+        """ Make slot new take the place of slot i under i's parent. """
+        parent = self._parent[i]
+        if new != NIL:
+            self._parent[new] = parent
+        if parent == NIL:
+            self._rootindex = new
+        elif self._left[parent] == i:
+            self._left[parent] = new
+        else:
+            self._right[parent] = new
+
+    def _update(self, i):
+        """ Recompute the stored size and height of slot i. """
+        left = self._left[i]
+        right = self._right[i]
+        height = self._height
+        self._size[i] = 1 + self._size[left] + self._size[right]
+        self._height[i] = 1 + max(height[left], height[right])
+
+    def _retrace(self, i):
+        """ Recompute stored sizes and heights from slot i to the root. """
+        while i != NIL:
+            self._update(i)
+            i = self._parent[i]
+
+    def rank(self, key):
+        """ Return the number of items in the tree ordered before key. """
+        left = self._left
+        right = self._right
+        keys = self._keys
+        size = self._size
+        rank = 0
+        i = self._rootindex
+        while i != NIL:
+            if key < keys[i]:
+                i = left[i]
+            elif key > keys[i]:
+                rank += 1 + size[left[i]]
+                i = right[i]
+            else:
+                return rank + size[left[i]]
+        return rank
+
+    def select_node(self, k):
+        """ Return the slot at (0-based) in-order position k, or None. """
+        if k < 0 or k >= self.size():
+            return None
+        i = self._rootindex
+        while True:
+            leftsize = self._size[self._left[i]]
+            if k < leftsize:
+                i = self._left[i]
+            elif k > leftsize:
+                k -= leftsize + 1
+                i = self._right[i]
+            else:
+                return i
+
+    def select(self, k):
+        """ Return the item at (0-based) in-order position k, or None. """
+        i = self.select_node(k)
+        if i is None:
+            return None
+        return self._items[i]
+
+    def _properBST(self):
+        """ Return True if the links, metadata and ordering are all proper. """
+        root = self._rootindex
+        if root != NIL and self._parent[root] != NIL:
+            return False
+        previous = None
+        count = 0
+        stack = [root] if root != NIL else []
+        while stack:
+            i = stack.pop()
+            for child in (self._left[i], self._right[i]):
+                if child != NIL:
+                    if self._parent[child] != i:
+                        return False
+                    stack.append(child)
+            left = self._left[i]
+            right = self._right[i]
+            if self._size[i] != 1 + self._size[left] + self._size[right]:
+                return False
+            if self._height[i] != 1 + max(self._height[left], self._height[right]):
+                return False
+        for item in self:
+            count += 1
+            if previous is not None and not previous < item.sort_key():
+                return False
+            previous = item.sort_key()
+        return count == self.size()
+
+    def _test():
+        from bst import TestClass
+        tree = ArrayBST(TestClass("D", "d"))
+        for field1 in ["B", "F", "A", "C", "E", "G", "C"]:
+            tree.add(TestClass(field1, field1.lower()))
+        print('Ordered:', tree, '; proper BST:', tree._properBST())
+        print(tree._stats(), '; rank of C:', tree.rank("C"),
+              '; select(4):', tree.select(4))
+        print('removing D:', tree.remove(TestClass("D")), '; removing Z:',
+              tree.remove(TestClass("Z")))
+        print('Ordered:', tree, '; proper BST:', tree._properBST())
+        print('adding H reuses slot', tree._free[-1], ':', tree.add(TestClass("H")))
+        copied = tree.copy()
+        copied.remove(TestClass("A"))
+        print('copy:', copied, '; original:', tree)
+        print('range B to E:', [str(e) for e in tree.range("B", "E")],
+              '; from position 4:', [str(e) for e in tree.elements_from(4)])
+        return tree
+
+
+class ArrayAVL(ArrayBST):
+    """ An ArrayBST kept balanced by AVL rotations, like AVLNode. """
+
+    def _balance(self, i):
+        """ Return the height of slot i's left subtree minus its right's. """
+        return self._height[self._left[i]] - self._height[self._right[i]]
+
+    def _rotate_right(self, i):
+        """ Rotate slot i down to the right; return the slot now above. """
+        pivot = self._left[i]
+        inner = self._right[pivot]
+        self._left[i] = inner
+        if inner != NIL:
+            self._parent[inner] = i
+        self._replace_in_parent(i, pivot)
+        self._right[pivot] = i
+        self._parent[i] = pivot
+        self._update(i)
+        self._update(pivot)
+        return pivot
+
+    def _rotate_left(self, i):
+        """ Rotate slot i down to the left; return the slot now above. """
+        pivot = self._right[i]
+        inner = self._left[pivot]
+        self._right[i] = inner
+        if inner != NIL:
+            self._parent[inner] = i
+        self._replace_in_parent(i, pivot)
+        self._left[pivot] = i
+        self._parent[i] = pivot
+        self._update(i)
+        self._update(pivot)
+        return pivot
+
+    def _retrace(self, i):
+        """ Restore sizes, heights and the AVL property from slot i to the
+        root.
+        """
+        while i != NIL:
+            self._update(i)
+            balance = self._balance(i)
+            if balance > 1:
+                if self._balance(self._left[i]) < 0:
+                    self._rotate_left(self._left[i])
+                i = self._rotate_right(i)
+            elif balance < -1:
+                if self._balance(self._right[i]) > 0:
+                    self._rotate_right(self._right[i])
+                i = self._rotate_left(i)
+            i = self._parent[i]
+
+    def _isbalanced(self):
+        """ Return True if every slot in the tree is AVL-balanced. """
+        for i in range(1, len(self._items)):
+            if self._items[i] is not None and abs(self._balance(i)) > 1:
+                return False
+        return True
+
+    def _test():
+        from bst import TestClass
+        tree = ArrayAVL(TestClass("%04d" % 0))
+        for i in range(1, 1000):  # sorted input would degenerate a plain BST
+            tree.add(TestClass("%04d" % i))
+        print(tree._stats(), '; proper BST:', tree._properBST(),
+              '; balanced:', tree._isbalanced())
+        for i in range(0, 1000, 3):
+            tree.remove(TestClass("%04d" % i))
+        print(tree._stats(), '; proper BST:', tree._properBST(),
+              '; balanced:', tree._isbalanced())
+        return tree
+
+
+if __name__ == '__main__':
+    ArrayBST._test()
+    print('++++++++++')
+    ArrayAVL._test()
@@ -0,0 +1,390 @@
+#author Karim Ulmann
+
+""" Benchmarks for the movie library.
+
+Run them all with:  python benchmarks.py
+or some of them with:  python benchmarks.py memory ...
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from bst import AVLNode
+from movieLib import MOVIES, Movie, MovieLib, MovieReader, delta_lines
+from sharded import ShardedCatalogue
+from threadsafe import SharedMovieLib
+from journal import JournaledMovieLib
+
+
+class _DictMovie:
+    """ A movie laid out as Movie was before it had slots: a __dict__ per
+    instance, with the date and runtime kept as the raw strings read from
+    the file.
+    """
+
+    def __init__(self, title, date, runtime):
+        self._title = title
+        self._date = date
+        self._time = runtime
+
+
+class _DictNode:
+    """ A tree node laid out as BSTNode was before it had slots. """
+
+    def __init__(self, item):
+        self._element = item
+        self._leftchild = None
+        self._rightchild = None
+        self._parent = None
+
+
+def bench_memory(filename=MOVIES):
+    """ Report the memory held per movie by a library built from filename,
+    for the old dict-based layout and for the current one.
+    """
+    with open(filename, encoding="utf8") as file:
+        lines = file.readlines()
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    nodes = []
+    for line in lines:
+        fields = line.split('\t')
+        nodes.append(_DictNode(_DictMovie(fields[0], fields[1], fields[2])))
+    dictbytes = tracemalloc.get_traced_memory()[0] - start
+    del nodes
+
+    start = tracemalloc.get_traced_memory()[0]
+    library = MovieLib.from_records(MovieReader(filename))
+    slotbytes = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    print('memory per movie (%s):' % filename)
+    print('  dict layout, string fields: %6.1f bytes'
+          % (dictbytes / len(lines)))
+    print('  slots, int date and runtime: %6.1f bytes'
+          % (slotbytes / library.size()))
+
+
+def bench_shared(filename=MOVIES, threads=(1, 2, 4, 8), operations=200000,
+                 writes=0.05):
+    """ Report search throughput on a SharedMovieLib under a mixed load.
+
+    Each of a pool of threads runs its share of the operations; a fraction
+    writes of them are writes (adding a new title, or removing one the
+    thread added), the rest searches for random titles from filename.
+    """
+    library = SharedMovieLib.from_records(MovieReader(filename), balanced=True)
+    titles = [movie.get_title() for movie in library]
+    print('shared library, %d%% reads / %d%% writes (%s):'
+          % (round(100 * (1 - writes)), round(100 * writes), filename))
+
+    def work(seed, count):
+        rng = random.Random(seed)
+        searches = 0
+        added = []
+        for i in range(count):
+            if rng.random() < writes:
+                if added and rng.random() < 0.5:
+                    library.remove(added.pop())
+                else:
+                    added.append('zz benchmark %d %d' % (seed, i))
+                    library.add(added[-1], None, 90)
+            else:
+                library.search(rng.choice(titles))
+                searches += 1
+        return searches
+
+    for count in threads:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(count) as pool:
+            searches = sum(pool.map(work, range(count),
+                                    [operations // count] * count))
+        seconds = time.perf_counter() - start
+        print('  %2d threads: %8.0f searches/s' % (count, searches / seconds))
+
+
+def bench_lookup_many(filename=MOVIES, counts=(1000, 10000, 40000),
+                      misses=0.1, repeats=5):
+    """ Report the best of repeats times to look up a batch of count titles,
+    one by one and with lookup_many, on each kind of tree.
+
+    The batch is random titles from filename, with a fraction misses of
+    them titles that are not there.  Only the lookups are timed (not
+    search's formatting, which would swamp them).
+    """
+    records = list(MovieReader(filename))
+    rng = random.Random(0)
+    libraries = [(name, MovieLib.from_records(records, **options))
+                 for name, options in [
+                     ('plain', {}), ('AVL', {'balanced': True}),
+                     ('array AVL', {'balanced': True, 'arrays': True}),
+                     ('persistent', {'persistent': True})]]
+    for count in counts:
+        titles = [rng.choice(records)[0] if rng.random() >= misses
+                  else 'zz missing %d' % i for i in range(count)]
+        print('looking up %d titles (%s):' % (count, filename))
+        for name, library in libraries:
+            assert library.lookup_many(titles) == {
+                title: library.lookup(title) for title in titles}
+            single = _best(lambda: {title: library.lookup(title)
+                                    for title in titles}, repeats)
+            batched = _best(lambda: library.lookup_many(titles), repeats)
+            print('  %-10s  one by one %7.4fs   lookup_many %7.4fs   (x%.1f)'
+                  % (name, single, batched, single / batched))
+
+
+def _best(work, repeats):
+    """ Return the shortest time, in seconds, of repeats calls of work(). """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        work()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench_hashed(filename=MOVIES, count=100000, hits=(1.0, 0.9, 0.5, 0.0)):
+    """ Report the cost of count exact-title lookups on a balanced library,
+    with and without the dict from title to editions, for each fraction
+    hits of the titles looked up being in the library; and the memory the
+    dict takes.
+    """
+    records = list(MovieReader(filename))
+    titles = [record[0] for record in records]
+    plain = MovieLib.from_records(records, balanced=True)
+    hashed = MovieLib.from_records(records, balanced=True, hashed=True)
+    print('exact-title lookups, %d per run (%s):' % (count, filename))
+    # the dict shares its keys and values with the tree, so it costs
+    # just its own table
+    print('  the dict costs %.1f bytes per title'
+          % (sys.getsizeof(hashed._titleindex) / hashed.titles()))
+    for hit in hits:
+        rng = random.Random(0)
+        batch = [rng.choice(titles) if rng.random() < hit
+                 else 'zz missing %d' % i for i in range(count)]
+        timings = []
+        for library in (plain, hashed):
+            lookup = library.lookup
+            start = time.perf_counter()
+            for title in batch:
+                lookup(title)
+            timings.append((time.perf_counter() - start) / count * 1e6)
+        print('  %3d%% hits:  tree %5.2f us   dict %5.2f us   (x%.1f)'
+              % (round(100 * hit), timings[0], timings[1],
+                 timings[0] / timings[1]))
+
+
+def _operator_search(node, searchitem):
+    """ Search as BSTNode.search_node did before nodes cached their keys,
+    comparing elements with > and < at every level.
+    """
+    while node is not None:
+        if node._element > searchitem:
+            node = node._leftchild
+        elif node._element < searchitem:
+            node = node._rightchild
+        else:
+            return node
+    return None
+
+
+def _method_search(node, key):
+    """ Search as BSTNode.find_node did before nodes cached their keys,
+    calling sort_key() on the element at every level.
+    """
+    while node is not None:
+        nodekey = node._element.sort_key()
+        if nodekey > key:
+            node = node._leftchild
+        elif nodekey < key:
+            node = node._rightchild
+        else:
+            return node
+    return None
+
+
+def bench_keys(filename=MOVIES, count=100000):
+    """ Report the cost of a title search in an AVL tree of the movies in
+    filename, comparing elements with operators, comparing keys fetched with
+    sort_key(), and comparing the keys cached in the nodes.
+    """
+    movies = [Movie(title, date, runtime)
+              for title, date, runtime in MovieReader(filename)]
+    movies.sort(key=Movie.sort_key)
+    root = AVLNode.from_sorted(movies)
+    rng = random.Random(0)
+    probes = [rng.choice(movies) for _ in range(count)]
+    keys = [movie.sort_key() for movie in probes]
+    print('title searches, %d per run (%s):' % (count, filename))
+    timings = []
+    for name, search, args in [
+            ('element operators', _operator_search, probes),
+            ('sort_key() calls', _method_search, keys),
+            ('cached keys', AVLNode.find_node, keys)]:
+        start = time.perf_counter()
+        for arg in args:
+            search(root, arg)
+        timings.append((time.perf_counter() - start) / count * 1e6)
+        print('  %-18s %5.2f us   (x%.1f)'
+              % (name, timings[-1], timings[0] / timings[-1]))
+
+
+def bench_delete(filename=MOVIES, rounds=3):
+    """ Report remove and add throughput when a random half of the titles
+    in filename is removed and then added back, round after round, checking
+    the tree is a proper BST after every step.
+    """
+    records = list(MovieReader(filename))
+    print('remove and re-add random halves, %d rounds (%s):'
+          % (rounds, filename))
+    for name, options in [('plain', {}), ('AVL', {'balanced': True}),
+                          ('array AVL', {'balanced': True, 'arrays': True})]:
+        library = MovieLib.from_records(records, **options)
+        titles = sorted({record[0] for record in records})
+        rng = random.Random(0)
+        removing = adding = 0.0
+        changes = readded = 0
+        proper = True
+        for _ in range(rounds):
+            half = rng.sample(titles, len(titles) // 2)
+            start = time.perf_counter()
+            removed = []
+            for title in half:
+                removed.extend(library.editions(title))
+                library.remove(title)
+            removing += time.perf_counter() - start
+            proper = proper and library.bst._properBST()
+            start = time.perf_counter()
+            for movie in removed:
+                library.add(movie.get_title(), movie._date, movie.get_runtime())
+            adding += time.perf_counter() - start
+            proper = proper and library.bst._properBST()
+            changes += len(half)
+            readded += len(removed)
+        print('  %-10s %8.0f removes/s  %8.0f adds/s   size %d, height %d,'
+              ' proper BST: %s'
+              % (name, changes / removing, readded / adding, library.size(),
+                 library.height(), proper))
+
+
+def bench_sharded(filename=MOVIES, workers=(1, 2, 4), clients=8,
+                  batches=400, batch=50):
+    """ Report lookup throughput on a ShardedCatalogue with each number of
+    worker processes.
+
+    A pool of client threads sends batches of lookups for random titles
+    from filename (lookup_many, so each batch goes to every shard it
+    touches at once) along with a page query per batch.  Only one request
+    at a time goes to a shard, so throughput can grow with the number of
+    workers up to the number of cores.
+    """
+    titles = sorted({record[0] for record in MovieReader(filename)})
+    print('sharded catalogue, %d client threads (%s):' % (clients, filename))
+
+    def work(seed):
+        rng = random.Random(seed)
+        found = 0
+        for i in range(batches // clients):
+            wanted = [rng.choice(titles) for j in range(batch)]
+            found += sum([movie is not None
+                          for movie in catalogue.lookup_many(wanted).values()])
+            catalogue.page(rng.randrange(len(titles)), 20)
+        return found
+
+    for count in workers:
+        with ShardedCatalogue(filename, count, balanced=True) as catalogue:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(clients) as pool:
+                found = sum(pool.map(work, range(clients)))
+            seconds = time.perf_counter() - start
+        print('  %2d workers: %8.0f lookups/s' % (count, found / seconds))
+
+
+def bench_delta(filename=MOVIES, changes=(10, 100, 1000)):
+    """ Report the cost of bringing a library up to date with a changed
+    movie file by diff and apply_delta, against rebuilding it.
+
+    The changed file is filename with a number of random records given a
+    new running time; the diff is timed apart from applying its feed.
+    """
+    records = list(MovieReader(filename))
+    library = MovieLib.from_records(records, balanced=True)
+    print('delta sync against a rebuild (%s):' % filename)
+    for count in changes:
+        rng = random.Random(count)
+        changed = list(records)
+        for i in rng.sample(range(len(changed)), count):
+            title, date, runtime = changed[i]
+            changed[i] = (title, date, (runtime or 0) + 1)
+        start = time.perf_counter()
+        upstream = MovieLib.from_records(changed, balanced=True)
+        rebuild = time.perf_counter() - start
+        start = time.perf_counter()
+        feed = list(delta_lines(library.diff(upstream)))
+        diffing = time.perf_counter() - start
+        synced = library.snapshot()
+        start = time.perf_counter()
+        synced.apply_delta(feed)
+        applying = time.perf_counter() - start
+        print('  %5d changes: rebuild %6.3fs   diff %6.3fs   apply %6.4fs'
+              ' (%d feed lines)' % (count, rebuild, diffing, applying, len(feed)))
+
+
+def bench_journal(filename=MOVIES, threads=(1, 4, 16), adds=2000):
+    """ Report add throughput on a JournaledMovieLib, and how many changes
+    each fsync of the journal covers, as the number of writing threads
+    grows (group commit).
+    """
+    folder = tempfile.mkdtemp()
+    base = os.path.join(folder, 'movies.snap')
+    MovieLib.from_records(MovieReader(filename)).save(base)
+    print('journaled adds (%s):' % filename)
+    for durable in (True, False):
+        for count in threads:
+            log = os.path.join(folder, 'movies%d%s.journal' % (count, durable))
+            library = JournaledMovieLib.open(base, log, durable, balanced=True)
+            library.add('zz warm up', None, 1)  # thaw the snapshot first
+            syncs = library._journal.syncs
+
+            def work(seed):
+                for i in range(adds // count):
+                    library.add('zz benchmark %d %d' % (seed, i), None, 90)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(count) as pool:
+                list(pool.map(work, range(count)))
+            seconds = time.perf_counter() - start
+            syncs = library._journal.syncs - syncs
+            library.close()
+            print('  %-12s %2d threads: %8.0f adds/s, %5.1f adds per sync'
+                  % ('fsync' if durable else 'flush only', count,
+                     adds / seconds, adds / syncs))
+
+
+BENCHMARKS = {
+    'memory': bench_memory,
+    'shared': bench_shared,
+    'lookup_many': bench_lookup_many,
+    'hashed': bench_hashed,
+    'keys': bench_keys,
+    'delete': bench_delete,
+    'sharded': bench_sharded,
+    'delta': bench_delta,
+    'journal': bench_journal,
+}
+
+
+def main(names):
+    """ Run the named benchmarks, or all of them if names is empty. """
+    for name in names or BENCHMARKS:
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
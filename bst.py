@@ -2,11 +2,15 @@
 
 from functools import total_ordering
 
+from walks import TreeWalks, linked
+
 
 @total_ordering
 class TestClass:
     """ Represents an arbitrary thing, for testing the BST. """
 
+    __slots__ = ('_field1', '_field2')
+
     def __init__(self, field1, field2=None):
         """ Initialise an object. """
         self._field1 = field1
@@ -23,6 +27,10 @@ class TestClass:
         outstr = outstr + str(self._field2)
         return outstr
 
+    def sort_key(self):
+        """ Return the value this object is ordered by (its field1). """
+        return self._field1
+
     def __eq__(self, other):
         """ Return True if this object has exactly same field1 as other. """
         if (other._field1 == self._field1):
@@ -43,42 +51,73 @@ class TestClass:
         return False
 
 
-class BSTNode:
-    """ An internal node for a Binary Search Tree.  """
+def _nodeheight(node):
+    """ Return the stored height of node, or -1 for an empty subtree. """
+    if node is None:
+        return -1
+    return node._height
+
+
+def _nodesize(node):
+    """ Return the stored size of node, or 0 for an empty subtree. """
+    if node is None:
+        return 0
+    return node._size
+
+
+class BSTNode(TreeWalks):
+    """ An internal node for a Binary Search Tree.
+
+    Each node also records the size and height of the subtree rooted at it.
+    These are kept up to date by add and remove_node, so size() and height()
+    are O(1).  It also caches its element's sort_key(), so searches compare
+    keys directly rather than calling a method (or a comparison operator on
+    the elements) at every level.
+    """
+
+    __slots__ = ('_element', '_key', '_leftchild', '_rightchild', '_parent',
+                 '_size', '_height')
 
     def __init__(self, item):
         """ Initialise a BSTNode on creation, with value==item. """
         self._element = item
+        self._key = item.sort_key()
         self._leftchild = None
         self._rightchild = None
         self._parent = None
+        self._size = 1
+        self._height = 0
 
-    def __str__(self):
-        """ Return a string representation of the tree rooted at this node.
+    @classmethod
+    def from_sorted(cls, items):
+        """ Return the root of a height-optimal tree holding items, or None.
 
-        The string will be created by an in-order traversal.
+        Args:
+            items: a list of objects in strictly increasing order (sorted and
+                with no duplicates); it is not checked
+
+        Builds the tree directly, taking the middle item of each slice as
+        the root of its subtree, so it costs O(n) with no comparisons.  The
+        result is perfectly balanced, which also makes it a valid AVL tree.
         """
+        return cls._build(items, 0, len(items), None)
 
-        ans = ''
-        if self._parent is None:  # root
-            root = self
-            if root._leftchild:
-                ans = ans + str(root._leftchild)
-            ans = ans + ' ' + str(root._element) + ','
-            if root._rightchild:
-                ans = ans + str(root._rightchild)
-        else:
-            if self._leftchild:
-                ans = ans + str(self._leftchild)
-            ans = ans + ' ' + str(self._element) + ','
-            if self._rightchild:
-                ans = ans + str(self._rightchild)
-        return ans
-
-    def _stats(self):
-        """ Return the basic stats on the tree. """
-        return ('size = ' + str(self.size())
-                + '; height = ' + str(self.height()))
+    @classmethod
+    def _build(cls, items, lo, hi, parent):
+        """ Return the root of a balanced subtree holding items[lo:hi]. """
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        node = cls(items[mid])
+        node._parent = parent
+        node._leftchild = cls._build(items, lo, mid, node)
+        node._rightchild = cls._build(items, mid + 1, hi, node)
+        node._update()
+        return node
+
+    def _walk(self):
+        """ Return the accessors TreeWalks needs to walk this subtree. """
+        return linked(self, _nodesize)
 
     def search(self, searchitem):
         """ Return object matching searchitem, or None.
@@ -87,8 +126,9 @@ class BSTNode:
             searchitem: an object of any class stored in the BST
 
         """
-        if self.search_node(searchitem):
-            return self.search_node(searchitem)._element.full_str()
+        node = self.search_node(searchitem)
+        if node is not None:
+            return node._element.full_str()
         else:
             return None
 
@@ -98,53 +138,87 @@ class BSTNode:
         Args:
             searchitem: an object of any class stored in the BST
         """
+        return self.find_node(searchitem.sort_key())
+
+    def find_node(self, key):
+        """ Return the BSTNode whose element has sort_key() == key, or None.
+
+        This lets callers search by key (e.g. a title string) without
+        building a throwaway object to compare against.
+
+        Args:
+            key: a value of the type returned by the elements' sort_key()
+        """
         cur = self
-        if cur is None:
-            return None
-        elif cur._element > searchitem:
-            if cur._leftchild:
-                return self._leftchild.search_node(searchitem)
-            else:
-                return None
-        elif cur._element < searchitem:
-            if cur._rightchild:
-                return self._rightchild.search_node(searchitem)
+        while cur is not None:
+            curkey = cur._key
+            if curkey > key:
+                cur = cur._leftchild
+            elif curkey < key:
+                cur = cur._rightchild
             else:
-                return None
-        else:
-            return self
+                return cur
+        return None
+
+    def find(self, key):
+        """ Return the element whose sort_key() == key, or None. """
+        node = self.find_node(key)
+        if node is None:
+            return None
+        return node._element
 
     def add(self, obj):
         """ Add item to the tree, maintaining BST properties.
 
         Returns the item added, or None if a matching object was already there.
         """
-
-        if obj < self._element:
-            if self._leftchild is None:
-                # make new node
-                self._leftchild = BSTNode(obj)
-                self._leftchild._parent = self
-                return obj
-            else:
-                return self._leftchild.add(obj)
-        elif obj > self._element:
-            if self._rightchild is None:
-                # make new node
-                self._rightchild = BSTNode(obj)
-                self._rightchild._parent = self
-                return obj
+        key = obj.sort_key()
+        cur = self
+        while True:
+            if key < cur._key:
+                if cur._leftchild is None:
+                    # make new node
+                    cur._leftchild = self.__class__(obj)
+                    cur._leftchild._parent = cur
+                    cur._retrace()
+                    return obj
+                cur = cur._leftchild
+            elif key > cur._key:
+                if cur._rightchild is None:
+                    # make new node
+                    cur._rightchild = self.__class__(obj)
+                    cur._rightchild._parent = cur
+                    cur._retrace()
+                    return obj
+                cur = cur._rightchild
             else:
-                return self._rightchild.add(obj)
-        else:
+                return None
+
+    def replace(self, obj):
+        """ Put obj in place of the element with the same sort_key(), and
+        return that element (or None, leaving the tree alone, if there is
+        none).
+        """
+        node = self.find_node(obj.sort_key())
+        if node is None:
             return None
+        old = node._element
+        node._element = obj
+        return old
+
+    def root(self):
+        """ Return the root of the tree containing this node. """
+        node = self
+        while node._parent is not None:
+            node = node._parent
+        return node
 
     def findmaxnode(self):
         """ Return the BSTNode with maximal element at or below here. """  # what to return about node or node without subtree
-        if not self._rightchild:
-            return self
-        else:
-            return self._rightchild.findmaxnode()
+        node = self
+        while node._rightchild is not None:
+            node = node._rightchild
+        return node
 
     def height(self):
         """ Return the height of this node.
@@ -152,13 +226,7 @@ class BSTNode:
         Note that with the recursive definition of the tree the height of the
         node is the same as the depth of the tree rooted at this node.
         """
-        lefter = -1
-        righter = -1
-        if self._leftchild:
-            lefter = self._leftchild.height()
-        if self._rightchild:
-            righter = self._rightchild.height()
-        return 1 + max(lefter, righter)
+        return self._height
 
     def size(self):
         """ Return the size of this subtree.
@@ -166,16 +234,85 @@ class BSTNode:
         The size is the number of nodes (or elements) in the tree, 
         including this node.
         """
-        righter = self._rightchild
-        lefter = self._leftchild
-        if not righter and not lefter:
-            return 1
-        elif lefter and not righter:
-            return 1 + lefter.size()
-        elif righter and not lefter:
-            return 1 + righter.size()
-        else:
-            return 1 + lefter.size() + righter.size()
+        return self._size
+
+    def rank(self, key):
+        """ Return the number of elements in this subtree ordered before key.
+
+        For an element that is in the tree this is its (0-based) position in
+        an in-order traversal.  Uses the stored subtree sizes, so it costs a
+        single descent.
+
+        Args:
+            key: a value of the type returned by the elements' sort_key()
+        """
+        rank = 0
+        cur = self
+        while cur is not None:
+            curkey = cur._key
+            if key < curkey:
+                cur = cur._leftchild
+            elif key > curkey:
+                rank += 1 + _nodesize(cur._leftchild)
+                cur = cur._rightchild
+            else:
+                return rank + _nodesize(cur._leftchild)
+        return rank
+
+    def select_node(self, k):
+        """ Return the BSTNode at (0-based) in-order position k in this
+        subtree, or None if k is out of range.
+        """
+        if k < 0 or k >= self._size:
+            return None
+        cur = self
+        while True:
+            leftsize = _nodesize(cur._leftchild)
+            if k < leftsize:
+                cur = cur._leftchild
+            elif k > leftsize:
+                k -= leftsize + 1
+                cur = cur._rightchild
+            else:
+                return cur
+
+    def select(self, k):
+        """ Return the element at (0-based) in-order position k, or None. """
+        node = self.select_node(k)
+        if node is None:
+            return None
+        return node._element
+
+    def successor(self):
+        """ Return the BSTNode that follows this one in order, or None.
+
+        Follows the _parent links, so this may leave the subtree rooted here.
+        """
+        node = self._rightchild
+        if node is not None:
+            while node._leftchild is not None:
+                node = node._leftchild
+            return node
+        node = self
+        while node._parent is not None and node._parent._rightchild is node:
+            node = node._parent
+        return node._parent
+
+    def _update(self):
+        """ Recompute the stored size and height of this node from its
+        children.
+        """
+        left = self._leftchild
+        right = self._rightchild
+        self._size = 1 + _nodesize(left) + _nodesize(right)
+        self._height = 1 + max(_nodeheight(left), _nodeheight(right))
+
+    def _retrace(self):
+        """ Recompute stored sizes and heights from this node to the root. """
+        node = self
+        while node is not None:
+            node._update()
+            node = node._parent
 
     def leaf(self):
         """ Return True if this node has no children. """  # ask about returning only true or the false
@@ -220,118 +357,208 @@ class BSTNode:
             searchitem - an object of any class stored in the BST
 
         Remove the matching object from the tree rooted at this node.
-        Maintains the BST properties.
+        Maintains the BST properties.  This node stays in the tree (for an
+        AVL tree it may no longer be the root: use root()): if it held the
+        object, a neighbouring element is moved into it and that element's
+        node is unlinked instead.
+
+        Raises ValueError if the object is the only one in the tree, which
+        cannot be emptied through one of its nodes: use delete.
         """
         # search for item if in tree
-        searchitem = self.search_node(searchitem)
-        if searchitem == None:
+        node = self.search_node(searchitem)
+        if node is None:
             return None
+        if node is not self:
+            return node.remove_node()  # call the remove the node function
+        # keep this node, the caller's handle on the tree, in the tree
+        if self._leftchild is not None:
+            neighbour = self._leftchild.findmaxnode()
+        elif self._rightchild is not None:
+            neighbour = self._rightchild
+            while neighbour._leftchild is not None:
+                neighbour = neighbour._leftchild
         else:
-            searchitem.remove_node()  # call the remove the node function
-            return searchitem
+            raise ValueError('cannot remove the only element of a tree;'
+                             ' use delete')
+        element = self._element
+        self._element = neighbour.remove_node()
+        self._key = neighbour._key
+        return element
+
+    def delete(self, key):
+        """ Remove the element with sort_key() == key from the tree rooted
+        at this node.
+
+        Returns (root, element): the root of the tree afterwards (None if it
+        is now empty) and the element removed (None if there was none).
+        Costs one descent to find the node and then O(1) relinking, plus
+        the walk back up to fix the sizes and heights.
+        """
+        node = self.find_node(key)
+        if node is None:
+            return self, None
+        # any neighbour of node stays in the tree, to find the root from
+        survivor = node._parent
+        if survivor is None:
+            survivor = node._leftchild
+        if survivor is None:
+            survivor = node._rightchild
+        element = node.remove_node()
+        if survivor is None:
+            return None, element
+        return survivor.root(), element
 
     def remove_node(self):
-        """ Remove this BSTNode from its tree, and return its element.
-
-        Maintains the BST properties.
+        """ Unlink this BSTNode from its tree, and return its element.
+
+        Maintains the BST properties.  Nodes are relinked rather than
+        elements moved between them: a node with one child or none is
+        replaced by that child, and a full node by its predecessor (the
+        biggest node in its left subtree, which has no right child, so is
+        first replaced by its own left child).  If this was the root, the
+        new root is the root() of any node left in the tree.
         """
         removee = self
         parent = removee._parent
-        # if this is a full node
-        # find the biggest item in the left tree
-        #  - there must be a left tree, since this is a full node
-        #  - the node for that item can have no right children
-        # move that item up into this item
-        # remove that old node, which is now a semileaf
-        # return the original element
-
-        if self.full() is True:
-            biggestLeft = removee._leftchild.findmaxnode()
-            biggestLeft_parent = biggestLeft._parent
-
-            if biggestLeft_parent._rightchild == removee:
-                removee = biggestLeft
-                removee._element = removee._rightchild._element
-                removee._rightchild.remove_node()
-                biggestLeft._parent = None
-                biggestLeft_parent._rightchild = None
-                return removee._element
-
+        left = removee._leftchild
+        right = removee._rightchild
+
+        if left is not None and right is not None:
+            pred = left.findmaxnode()
+            if pred is left:
+                # pred keeps its own left subtree
+                retrace = pred
             else:
-                removee._element = removee._leftchild._element
-                removee._leftchild.remove_node()
-                removee = biggestLeft
-                biggestLeft._parent = None
-                biggestLeft_parent._leftchild = None
-                return removee._element
-
-
-        # else if this has no children
-        # find who the parent was
-        # set the parent's appropriate child to None
-        # wipe this node
-        # return this node's element
-
-        elif self.leaf() is True:  # case if searchitem is a leaf.
-            if parent._rightchild == removee:
-                removee._parent = None
-                parent._rightchild = None
-                return removee._element
+                # splice pred out, then give it this node's left subtree
+                retrace = pred._parent
+                retrace._rightchild = pred._leftchild
+                if pred._leftchild is not None:
+                    pred._leftchild._parent = retrace
+                pred._leftchild = left
+                left._parent = pred
+            pred._rightchild = right
+            right._parent = pred
+            removee._replace_in_parent(pred)
+        else:
+            child = left if left is not None else right
+            retrace = parent
+            removee._replace_in_parent(child)
+
+        removee._parent = None
+        removee._leftchild = None
+        removee._rightchild = None
+        removee._size = 1
+        removee._height = 0
+        if retrace is not None:
+            retrace._retrace()
+        return removee._element
+
+    def _replace_in_parent(self, new):
+        """ Make new (which may be None) take the place of this node under
+        this node's parent.
+        """
+        parent = self._parent
+        if new is not None:
+            new._parent = parent
+        if parent is not None:
+            if parent._leftchild is self:
+                parent._leftchild = new
             else:
-                removee._parent = None
-                parent._leftchild = None
-                return removee._element
-
-        # else if this has no right child (but must have a left child)
-        # shift leftchild up into its place, and clean up
-        # return the original element
+                parent._rightchild = new
 
-        elif self._rightchild is None and self._leftchild is not None:
-            if removee._parent is None:
+    def split(self, key):
+        """ Split the tree rooted at this node into the elements whose
+        sort_key() is before key and the rest.
 
-                if removee._parent is None:  # if removee is a root
-                    removee._element = removee._leftchild._element
-                    removee._leftchild.remove_node()
+        Returns (left, right), the roots of the two trees (either may be
+        None).  The nodes are relinked into the two trees, walking back up
+        the search path for key and joining the pieces hanging off it, so
+        this tree is used up.  That costs O(height) for a plain tree, and
+        O(log n) for an AVL tree, whose halves are AVL trees too.
+        """
+        path = []
+        node = self
+        while node is not None:
+            goesleft = node._key < key
+            path.append((node, goesleft))
+            node = node._rightchild if goesleft else node._leftchild
+        left = right = None
+        for node, goesleft in reversed(path):
+            # the subtree hanging off the path goes with node
+            sub = node._leftchild if goesleft else node._rightchild
+            if sub is not None:
+                sub._parent = None
+            node._parent = None
+            node._leftchild = None
+            node._rightchild = None
+            if goesleft:
+                left = self._join3(sub, node, left)
             else:
+                right = self._join3(right, node, sub)
+        return left, right
 
-                if removee == parent._rightchild:  # need to check if the item we are removing is a left or right child of its parent
-                    parent._rightchild = removee._leftchild
-                    removee._leftchild._parent = removee._parent
-                    removee._parent = None
-                    removee._rightchild = None
-                    return removee._element
-
-                else:
-                    parent._leftchild = removee._leftchild
-                    removee._leftchild._parent = removee._parent
-                    removee._parent = None
-                    removee._leftchild = None
-                    return removee._element
-
-        # else this has no left child (but must have a right child)
-        # shift rightchild up into its place, and clean up
-        # return the original element
-
-        elif self._rightchild is not None and self._leftchild is None:
+    @classmethod
+    def join(cls, left, right):
+        """ Return the root of a tree holding the elements of the trees
+        rooted at left and right (either may be None), which are used up.
 
-            if removee._parent is None:  # if removee is a root
-                removee._element = removee._rightchild._element
-                removee._rightchild.remove_node()
+        Every element of left must be before every element of right; it is
+        not checked.  The biggest node of left is unlinked and then put
+        above left and right, so this costs O(height).
+        """
+        if left is None:
+            return right
+        if right is None:
+            return left
+        node = left.findmaxnode()
+        survivor = node._parent
+        if survivor is None:
+            survivor = node._leftchild
+        node.remove_node()
+        if survivor is None:
+            left = None
+        else:
+            left = survivor.root()
+        return cls._join3(left, node, right)
+
+    @classmethod
+    def _join3(cls, left, node, right):
+        """ Return the root of a tree of left, then the unlinked node, then
+        right, where left and right are roots (or None) whose elements are
+        before and after node's.
+        """
+        node._link(left, right)
+        return node
 
-            else:
-                if self == self._parent._rightchild:
-                    parent._rightchild = removee._rightchild
-                    removee._rightchild._parent = removee._parent
-                    removee._parent = None
-                    removee._rightchild = None
-                    return removee._element
-
-                else:
-                    parent._leftchild = removee._rightchild
-                    removee._rightchild._parent = removee._parent
-                    removee._parent = None
-                    removee._leftchild = None
-                    return removee._element
+    def _link(self, left, right):
+        """ Make left and right (roots, or None) the children of this node. """
+        self._leftchild = left
+        self._rightchild = right
+        if left is not None:
+            left._parent = self
+        if right is not None:
+            right._parent = self
+        self._update()
+
+    def remove_range(self, lo=None, hi=None):
+        """ Remove the elements whose sort_key() k has lo <= k < hi from the
+        tree rooted at this node.
+
+        Either bound may be None to leave that end open.  Returns (root,
+        removed), the roots of the trees of the elements left and of those
+        removed (either may be None).  Costs two splits and a join, so
+        O(log n) for an AVL tree however many elements go.
+        """
+        if lo is None:
+            below, rest = None, self
+        else:
+            below, rest = self.split(lo)
+        if hi is None or rest is None:
+            removed, above = rest, None
+        else:
+            removed, above = rest.split(hi)
+        return self.join(below, above), removed
 
     def _print_structure(self):
         """ (Private) Print a structured representation of tree at this node. """
@@ -393,6 +620,22 @@ class BSTNode:
 
         return (True, minvalue, maxvalue)
 
+    def _isaugmented(self):
+        """ Return True if every stored size, height and cached key below
+        here is right.
+        """
+        ok = self._key == self._element.sort_key()
+        if self._leftchild is not None:
+            ok = self._leftchild._isaugmented() and ok
+        if self._rightchild is not None:
+            ok = self._rightchild._isaugmented() and ok
+        if self._size != 1 + _nodesize(self._leftchild) + _nodesize(self._rightchild):
+            ok = False
+        if self._height != 1 + max(_nodeheight(self._leftchild),
+                                   _nodeheight(self._rightchild)):
+            ok = False
+        return ok
+
     def _isthisapropertree(self):
         """ Return True if this node is a properly implemented tree. """
         ok = True
@@ -438,6 +681,10 @@ class BSTNode:
         print(node.remove(removee))
         print(node.findmaxnode(), '--------------------')
         print(node._print_structure())
+        print('> removing Memento, held by the root')
+        print(node.remove(TestClass("Memento", "11/10/2000")))
+        node._print_structure()
+        print(node, '; size =', node.size(), '; proper BST:', node._properBST())
         return node
 
     def _test():
@@ -449,7 +696,7 @@ class BSTNode:
         print('Ordered:', node)
         node._print_structure()
         print('removing', "A")
-        node.remove(TestClass("A"))
+        node = node.delete("A")[0]
         print('Ordered:', node)
         node._print_structure()
         print('adding', "C")
@@ -457,7 +704,7 @@ class BSTNode:
         print('Ordered:', node)
         node._print_structure()
         print('removing', "C")
-        node.remove(TestClass("C"))
+        node = node.delete("C")[0]
         print('Ordered:', node)
         node._print_structure()
         print('adding', "F")
@@ -465,7 +712,7 @@ class BSTNode:
         print('Ordered:', node)
         node._print_structure()
         print('removing', "B")
-        node.remove(TestClass("B"))  # fix here
+        node = node.delete("B")[0]
         print('Ordered:', node)
         node._print_structure()
         print('adding', "C")
@@ -485,19 +732,19 @@ class BSTNode:
         print('Ordered:', node)
         node._print_structure()
         print('removing', "B")
-        node.remove(TestClass("B"))
+        node = node.delete("B")[0]
         print('Ordered:', node)
         node._print_structure()
         print('removing', "D")
-        node.remove(TestClass("D"))
+        node = node.delete("D")[0]
         print('Ordered:', node)
         node._print_structure()
         print('removing', "C")
-        node.remove(TestClass("C"))
+        node = node.delete("C")[0]
         print('Ordered:', node)
         node._print_structure()
         print('removing', "E")
-        node.remove(TestClass("E"))
+        node = node.delete("E")[0]
         print('Ordered:', node)
         node._print_structure()
         print('adding', "L")
@@ -517,23 +764,180 @@ class BSTNode:
         print('Ordered:', node)
         node._print_structure()
         print('removing', "L")
-        node.remove(TestClass("L"))
+        node = node.delete("L")[0]
         print('Ordered:', node)
         node._print_structure()
         print('removing', "H")
-        node.remove(TestClass("H"))
+        node = node.delete("H")[0]
         print('Ordered:', node)
         node._print_structure()
         print('removing', "I")
-        node.remove(TestClass("I"))
+        node = node.delete("I")[0]
         print('Ordered:', node)
         node._print_structure()
         print('removing', "G")
-        node.remove(TestClass("G"))
+        node = node.delete("G")[0]
         print('Ordered:', node)
         node._print_structure()
         print(node)
 
-BSTNode._testadd()
-print('++++++++++')
-BSTNode._test()
+    def _testorder():
+        node = BSTNode(TestClass("D", "d"))
+        for field1 in ["B", "F", "A", "C", "E", "G"]:
+            node.add(TestClass(field1, field1.lower()))
+        print('Ordered:', node)
+        print('rank of C:', node.rank("C"), '; rank of Ca:', node.rank("Ca"))
+        print('select(0):', node.select(0), '; select(6):', node.select(6),
+              '; select(7):', node.select(7))
+        start = node.select_node(2)
+        page = [start, start.successor(), start.successor().successor()]
+        print('page from 2:', [str(n._element) for n in page])
+        print('range C to F:', [str(e) for e in node.range("C", "F")])
+        print('range from E:', [str(e) for e in node.range("E")])
+        print('prefix B:', [str(e) for e in node.prefix("B")])
+        built = BSTNode.from_sorted([TestClass(f) for f in "ABCDEFG"])
+        print('built:', built, '; proper BST:', built._properBST(),
+              '; augmented:', built._isaugmented(), '; height =', built.height())
+        return node
+
+
+class AVLNode(BSTNode):
+    """ An internal node for a self-balancing (AVL) Binary Search Tree.
+
+    Uses the heights stored in every BSTNode: add and remove_node (via
+    _retrace) rotate the tree on the way back up to the root so that the
+    heights of the two subtrees of any node never differ by more than one.
+    This keeps the height of the tree O(log n) whatever order the items
+    arrive in.
+
+    Rotations relink nodes (keeping the _parent references consistent), so
+    the node at the root may change; use root() to find it again.
+    """
+
+    __slots__ = ()
+
+    def _balance(self):
+        """ Return the height of the left subtree minus that of the right. """
+        return _nodeheight(self._leftchild) - _nodeheight(self._rightchild)
+
+    def _rotate_right(self):
+        """ Rotate this node down to the right; return the node now above. """
+        pivot = self._leftchild
+        self._leftchild = pivot._rightchild
+        if pivot._rightchild is not None:
+            pivot._rightchild._parent = self
+        self._replace_in_parent(pivot)
+        pivot._rightchild = self
+        self._parent = pivot
+        self._update()
+        pivot._update()
+        return pivot
+
+    def _rotate_left(self):
+        """ Rotate this node down to the left; return the node now above. """
+        pivot = self._rightchild
+        self._rightchild = pivot._leftchild
+        if pivot._leftchild is not None:
+            pivot._leftchild._parent = self
+        self._replace_in_parent(pivot)
+        pivot._leftchild = self
+        self._parent = pivot
+        self._update()
+        pivot._update()
+        return pivot
+
+    def _retrace(self):
+        """ Restore sizes, heights and the AVL property from this node to the
+        root.
+        """
+        node = self
+        while node is not None:
+            node._update()
+            balance = node._balance()
+            if balance > 1:
+                if node._leftchild._balance() < 0:
+                    node._leftchild._rotate_left()
+                node = node._rotate_right()
+            elif balance < -1:
+                if node._rightchild._balance() > 0:
+                    node._rightchild._rotate_right()
+                node = node._rotate_left()
+            node = node._parent
+
+    @classmethod
+    def _join3(cls, left, node, right):
+        """ Return the root of an AVL tree of left, then the unlinked node,
+        then right, where left and right are the roots (or None) of AVL
+        trees whose elements are before and after node's.
+
+        If one tree is more than one taller, node goes down the inside
+        spine of that tree to a subtree about as tall as the other, and the
+        tree is rebalanced on the way back up.  That costs O(1 + the
+        difference in heights).
+        """
+        lh = _nodeheight(left)
+        rh = _nodeheight(right)
+        if lh > rh + 1:
+            parent = None
+            sub = left
+            while _nodeheight(sub) > rh + 1:
+                parent = sub
+                sub = sub._rightchild
+            if sub is not None:
+                sub._parent = None
+            node._link(sub, right)
+            parent._rightchild = node
+            node._parent = parent
+            parent._retrace()
+            return parent.root()
+        if rh > lh + 1:
+            parent = None
+            sub = right
+            while _nodeheight(sub) > lh + 1:
+                parent = sub
+                sub = sub._leftchild
+            if sub is not None:
+                sub._parent = None
+            node._link(left, sub)
+            parent._leftchild = node
+            node._parent = parent
+            parent._retrace()
+            return parent.root()
+        node._link(left, right)
+        return node
+
+    def _isbalanced(self):
+        """ Return True if every node below here is AVL-balanced. """
+        ok = True
+        if self._leftchild is not None:
+            ok = self._leftchild._isbalanced() and ok
+        if self._rightchild is not None:
+            ok = self._rightchild._isbalanced() and ok
+        if abs(self._balance()) > 1:
+            ok = False
+        return ok
+
+    def _test():
+        node = AVLNode(TestClass("%04d" % 0))
+        for i in range(1, 1000):  # sorted input would degenerate a plain BST
+            node.add(TestClass("%04d" % i))
+            node = node.root()
+        print('size =', node.size(), '; height =', node.height())
+        print('proper BST:', node._properBST(), '; balanced:', node._isbalanced(),
+              '; augmented:', node._isaugmented())
+        for i in range(0, 1000, 3):
+            node = node.delete("%04d" % i)[0]
+        print('size =', node.size(), '; height =', node.height())
+        print('proper BST:', node._properBST(), '; balanced:', node._isbalanced(),
+              '; augmented:', node._isaugmented())
+        return node
+
+
+if __name__ == '__main__':
+    BSTNode._testadd()
+    print('++++++++++')
+    BSTNode._test()
+    print('++++++++++')
+    BSTNode._testorder()
+    print('++++++++++')
+    AVLNode._test()
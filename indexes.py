@@ -0,0 +1,151 @@
+#author Karim Ulmann
+
+""" Secondary indexes, ordering a library's movies by something other than
+the title.
+
+An index is an ordinary search tree whose elements are IndexEntry objects,
+each pairing a movie with its key in the index.  Keys are tuples that end
+with the title (and for runtimes the release date too), so they are
+distinct even where many movies share a date or a runtime, and a range
+query over the tree costs one descent plus a step per movie returned.
+"""
+
+from functools import total_ordering
+
+
+def release_key(movie):
+    """ Return movie's key in a release date index, or None if its date is
+    unknown.
+    """
+    if movie._date is None:
+        return None
+    return (movie._date, movie._title)
+
+
+def runtime_key(movie):
+    """ Return movie's key in a runtime index, or None if its running time
+    is unknown.
+    """
+    if movie._time is None:
+        return None
+    return (movie._time, movie._title,
+            movie._date if movie._date is not None else 0)
+
+
+@total_ordering
+class IndexEntry:
+    """ A movie filed under its key in a secondary index. """
+
+    __slots__ = ('_key', '_movie')
+
+    def __init__(self, key, movie):
+        """ Initialise an entry for movie, under key. """
+        self._key = key
+        self._movie = movie
+
+    def __str__(self):
+        """ Return a short string representation of the movie. """
+        return str(self._movie)
+
+    def full_str(self):
+        """ Return a full string representation of the movie. """
+        return self._movie.full_str()
+
+    def sort_key(self):
+        """ Return the value entries are ordered by (the key). """
+        return self._key
+
+    def __eq__(self, other):
+        """ Return True if this entry has the same key as other. """
+        return self._key == other._key
+
+    def __lt__(self, other):
+        """ Return True if this entry is ordered before other. """
+        return self._key < other._key
+
+
+class SecondaryIndex:
+    """ An ordered index of movies on the key given by keyfunc.
+
+    Movies for which keyfunc returns None are left out.  The entries are
+    held in a tree of treeclass (any of the tree classes MovieLib can use),
+    which should be self-balancing: movie files tend to be in date order.
+    """
+
+    def __init__(self, keyfunc, treeclass):
+        """ Initialise an empty index. """
+        self._keyfunc = keyfunc
+        self._treeclass = treeclass
+        self._tree = None
+
+    @classmethod
+    def build(cls, keyfunc, treeclass, movies):
+        """ Return an index of movies, built in one go. """
+        index = cls(keyfunc, treeclass)
+        entries = []
+        for movie in movies:
+            key = keyfunc(movie)
+            if key is not None:
+                entries.append(IndexEntry(key, movie))
+        entries.sort(key=IndexEntry.sort_key)
+        index._tree = treeclass.from_sorted(entries)
+        return index
+
+    def size(self):
+        """ Return the number of movies in the index. """
+        if self._tree is None:
+            return 0
+        return self._tree.size()
+
+    def add(self, movie):
+        """ File movie in the index. """
+        key = self._keyfunc(movie)
+        if key is None:
+            return
+        entry = IndexEntry(key, movie)
+        if self._tree is None:
+            self._tree = self._treeclass(entry)
+        else:
+            self._tree.add(entry)
+            self._tree = self._tree.root()  # rebalancing may have moved the root
+
+    def remove(self, movie):
+        """ Take movie (or the movie with the same key) out of the index. """
+        key = self._keyfunc(movie)
+        if key is None or self._tree is None:
+            return
+        self._tree = self._tree.delete(key)[0]
+
+    def between(self, lo=None, hi=None):
+        """ Yield, in key order, the movies whose key k has lo <= k < hi.
+
+        Either bound may be None to leave that end open.
+        """
+        if self._tree is None:
+            return
+        for entry in self._tree.range(lo, hi):
+            yield entry._movie
+
+    def _properBST(self):
+        """ Return True if the index's tree is a proper search tree. """
+        return self._tree is None or self._tree._properBST()
+
+    def _test():
+        from bst import AVLNode
+        from movieLib import Movie
+        movies = [Movie('%03d' % i, 730000 + i % 7, 80 + i % 30)
+                  for i in range(200)]
+        index = SecondaryIndex.build(runtime_key, AVLNode, movies[:100])
+        for movie in movies[100:]:
+            index.add(movie)
+        for movie in movies[::3]:
+            index.remove(movie)
+        short = list(index.between(None, (90,)))
+        print('size =', index.size(), '; proper BST:', index._properBST(),
+              '; under 90 minutes:', len(short),
+              '; in order:', short == sorted(short, key=runtime_key))
+        return index
+
+
+if __name__ == '__main__':
+    SecondaryIndex._test()
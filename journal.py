@@ -0,0 +1,407 @@
+#author Karim Ulmann
+
+""" A write-ahead journal, so a library's changes survive a restart.
+
+The library lives in a base file (a movie file or a snapshot) plus a
+journal: an append-only file of the changes made since the base was
+written, one change feed line each (see MovieLib.apply_delta).  Opening
+the library loads the base and replays the journal over it; compacting
+writes the library as it is to a fresh snapshot, the base from then on,
+and drops the journal lines it now holds.  A movie file is never written
+over: a library based on one compacts into a snapshot of its own.  A
+change is only written once, to the end of the journal, so keeping it
+costs no more than the change itself.
+"""
+
+import os
+import tempfile
+import threading
+
+from movieLib import MOVIES, MovieLib, MovieReader, check_title, delta_lines
+from snapshot import is_snapshot
+from threadsafe import SharedMovieLib
+
+
+def _fsync_dir(path):
+    """ Flush the directory holding path, so a rename into it is durable. """
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal:
+    """ An append-only file of change feed lines, with group commit.
+
+    write appends lines and returns a ticket; sync(ticket) returns once
+    they are on disk.  The first thread to sync flushes and fsyncs for
+    everyone: threads that wrote meanwhile wait for it and then find their
+    lines already synced (or sync the lot written since), so under load
+    one fsync serves a whole group of changes.  With durable=False the
+    lines are only flushed to the operating system, which survives the
+    process crashing but not the machine.
+    """
+
+    def __init__(self, path, durable=True):
+        """ Open the journal at path, creating it if need be.
+
+        A last line cut short by a crash is truncated away, so the next
+        line written starts on a line of its own.
+        """
+        self.path = path
+        self.durable = durable
+        self.syncs = 0
+        with open(path, 'ab+') as file:
+            file.seek(0)
+            data = file.read()
+            if data and not data.endswith(b'\n'):
+                file.truncate(data.rfind(b'\n') + 1)
+        self._file = open(path, 'ab')
+        self._cond = threading.Condition(threading.Lock())
+        self._written = 0  # tickets handed out
+        self._synced = 0  # tickets known to be on disk
+        self._syncing = False
+
+    def lines(self):
+        """ Return a list of the lines in the journal. """
+        with self._cond:
+            self._file.flush()
+            with open(self.path, encoding='utf-8') as file:
+                return file.readlines()
+
+    def write(self, lines):
+        """ Append lines to the journal, and return a ticket for sync. """
+        data = ''.join(lines).encode('utf-8')
+        with self._cond:
+            if data:
+                self._file.write(data)
+                self._written += 1
+            return self._written
+
+    def sync(self, ticket):
+        """ Return once the lines written up to ticket are on disk. """
+        with self._cond:
+            while self._synced < ticket:
+                if self._syncing:
+                    # another thread is syncing: its fsync may cover us
+                    self._cond.wait()
+                    continue
+                self._syncing = True
+                target = self._written
+                try:
+                    self._file.flush()
+                    if self.durable:
+                        fd = self._file.fileno()
+                        self._cond.release()  # let others write meanwhile
+                        try:
+                            os.fsync(fd)
+                        finally:
+                            self._cond.acquire()
+                    self.syncs += 1
+                    self._synced = target
+                finally:
+                    self._syncing = False
+                    self._cond.notify_all()
+
+    def mark(self):
+        """ Return the length of the journal so far, flushing it. """
+        with self._cond:
+            self._file.flush()
+            return self._file.tell()
+
+    def trim(self, offset):
+        """ Drop the first offset bytes of the journal (as returned by mark).
+
+        The rest is copied to a new file which then replaces the journal,
+        so a crash leaves either the old journal or the new one.
+        """
+        with self._cond:
+            while self._syncing:
+                self._cond.wait()
+            self._file.flush()
+            with open(self.path, 'rb') as file:
+                file.seek(offset)
+                rest = file.read()
+            temp = self.path + '.tmp'
+            with open(temp, 'wb') as file:
+                file.write(rest)
+                file.flush()
+                os.fsync(file.fileno())
+            self._file.close()
+            os.replace(temp, self.path)
+            _fsync_dir(self.path)
+            self._file = open(self.path, 'ab')
+            self._synced = self._written
+
+    def close(self):
+        """ Sync and close the journal. """
+        self.sync(self._written)
+        with self._cond:
+            self._file.close()
+
+
+class JournaledMovieLib(SharedMovieLib):
+    """ A SharedMovieLib whose changes are written to a journal.
+
+    Open one with JournaledMovieLib.open.  Each call that changes the
+    library (add, remove, apply_batch, apply_delta, remove_range) writes the
+    movies it added and removed to the journal as a single group of lines
+    while it holds the write lock, so the journal is in the order the
+    changes were made, and then waits for them to be synced after letting go
+    of the lock, so concurrent writers share fsyncs.  A library made any
+    other way (e.g. by snapshot) has no journal, and its changes are not
+    kept; a journaled library cannot be split or joined, as that would move
+    its movies into libraries with none (RuntimeError).  A title holding a
+    tab or a line break could not be read back from the journal, so adding
+    one raises ValueError (see check_title) before anything is changed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """ Initialise a library with no journal; see MovieLib() for the
+        arguments.
+        """
+        SharedMovieLib.__init__(self, *args, **kwargs)
+        self._journal = None
+        self._target = None  # the snapshot compact writes
+        self._changes = []  # (kind, old, new) since the last journal write
+        self._depth = 0  # how deep in journaled calls this thread is
+
+    @classmethod
+    def open(cls, base, journal, durable=True, compact_to=None,
+             balanced=False, arrays=False, indexes=(), hashed=False):
+        """ Return the library held in base plus journal.
+
+        Args:
+            base - a movie file or snapshot (see Catalogue)
+            journal - the journal file; it is created if not there
+            durable - whether to fsync the journal (see Journal)
+            compact_to - the snapshot file compact writes; by default base
+                itself, which must then be a snapshot.  A movie file is
+                never written over, so a movie file base needs one.  Once
+                written it holds everything in base, and is loaded in its
+                place.
+            balanced, arrays, indexes, hashed - as for MovieLib()
+
+        The journal is replayed over the movies in the base, so the library
+        is as it was when the last synced change was made.
+
+        Raises ValueError if base is a movie file and compact_to is not
+        given, or if compact_to is a file but not a snapshot.
+        """
+        if compact_to is None:
+            if not is_snapshot(base):
+                raise ValueError('a movie file base needs a snapshot to'
+                                 ' compact into: ' + base)
+            compact_to = base
+        if os.path.exists(compact_to):
+            if not is_snapshot(compact_to):
+                raise ValueError('will not compact over a file that is not'
+                                 ' a snapshot: ' + compact_to)
+            base = compact_to
+        if is_snapshot(base):
+            library = cls.load(base, balanced, arrays, indexes, hashed)
+        else:
+            library = cls.from_records(MovieReader(base), balanced, arrays,
+                                       indexes=indexes, hashed=hashed)
+        log = Journal(journal, durable)
+        MovieLib.apply_delta(library, log.lines())
+        library._journal = log
+        library._target = compact_to
+        return library
+
+    def close(self):
+        """ Sync and close the journal. """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def compact(self):
+        """ Write the library to a fresh snapshot at the compaction target
+        (see open), and drop the journal lines it now holds.
+
+        Only the moment of pinning the library holds the write lock (which
+        costs O(1) for a persistent library, and a copy of the tree
+        otherwise); the snapshot is written while the library carries on,
+        so this may be run in the background (see start_compaction).  A
+        crash part way through is harmless: until the journal is trimmed,
+        replaying the lines the new base already holds leaves it as it is,
+        as each line only adds an edition that is not there or removes one
+        that is.
+        """
+        with self._lock.write():
+            pinned = MovieLib.snapshot(self)
+            offset = self._journal.mark()
+        temp = self._target + '.tmp'
+        pinned.save(temp)
+        with open(temp, 'rb') as file:
+            os.fsync(file.fileno())
+        os.replace(temp, self._target)
+        _fsync_dir(self._target)
+        self._journal.trim(offset)
+
+    def start_compaction(self):
+        """ Run compact in a background thread, and return the thread. """
+        thread = threading.Thread(target=self.compact, daemon=True)
+        thread.start()
+        return thread
+
+    def _journaled(self, method, *args):
+        """ Call method (a plain function of the library and args) under
+        the write lock, write the changes it made to the journal, and wait
+        for them to be synced once the lock is let go.
+
+        Nested calls (e.g. the adds an apply_batch makes) leave the writing
+        to the outermost one.
+        """
+        ticket = None
+        try:
+            with self._lock.write():
+                self._depth += 1
+                try:
+                    result = method(self, *args)
+                finally:
+                    self._depth -= 1
+                    if self._depth == 0 and self._changes:
+                        ticket = self._journal.write(delta_lines(self._changes))
+                        self._changes = []
+        finally:
+            if ticket is not None:
+                self._journal.sync(ticket)
+        return result
+
+    def _record(self, kind, old, new):
+        """ Note a change for the journal, if there is one. """
+        if self._journal is not None:
+            self._changes.append((kind, old, new))
+
+    def _add(self, title, date, runtime):
+        # checked before the change, as the journal could not replay it
+        check_title(title)
+        movie = MovieLib.add(self, title, date, runtime)
+        if movie is not None:
+            self._record('add', None, movie)
+        return movie
+
+    def _unindex(self, movies):
+        # every removal goes through here
+        MovieLib._unindex(self, movies)
+        for movie in movies:
+            self._record('remove', movie, None)
+
+    def add(self, title, date, runtime):
+        return self._journaled(JournaledMovieLib._add, title, date, runtime)
+
+    def remove(self, title, year=None):
+        return self._journaled(MovieLib.remove, title, year)
+
+    def apply_batch(self, adds=(), removes=()):
+        adds = list(adds)
+        for title, date, runtime in adds:
+            check_title(title)
+        return self._journaled(MovieLib.apply_batch, adds, removes)
+
+    def apply_delta(self, stream):
+        return self._journaled(MovieLib.apply_delta, stream)
+
+    def remove_range(self, lo=None, hi=None):
+        return self._journaled(MovieLib.remove_range, lo, hi)
+
+    def split(self, title):
+        if self._journal is not None:
+            raise RuntimeError('cannot split a journaled library: the halves'
+                               ' would have no journal')
+        return SharedMovieLib.split(self, title)
+
+    @classmethod
+    def join(cls, left, right):
+        for library in (left, right):
+            if getattr(library, '_journal', None) is not None:
+                raise RuntimeError('cannot join a journaled library: the'
+                                   ' result would have no journal')
+        return super().join(left, right)
+
+    def _test():
+        folder = tempfile.mkdtemp()
+        base = os.path.join(folder, 'movies.snap')
+        log = os.path.join(folder, 'movies.journal')
+        MovieLib.from_records(MovieReader(MOVIES)).save(base)
+        library = JournaledMovieLib.open(base, log, balanced=True)
+        library.add('Wonder Boys', '03/05/2000', 107)
+        library.remove('Star Wars')
+        library.apply_batch(adds=[('Zzz %d' % i, None, i) for i in range(5)],
+                            removes=['Alien'])
+        library.remove_range('Zzz 3', 'Zzz 9')
+        expected = [movie.full_str() for movie in library]
+        library.close()
+        with open(log, 'a', encoding='utf-8') as file:
+            file.write('+\tTorn by a cra')  # a crash part way through a line
+        reopened = JournaledMovieLib.open(base, log, balanced=True)
+        print('journal lines:', len(reopened._journal.lines()),
+              '; replayed:', [movie.full_str() for movie in reopened] == expected,
+              '; Star Wars:', reopened.search('Star Wars'),
+              '; Wonder Boys:', reopened.search('Wonder Boys'))
+
+        def writer(start):
+            for i in range(start, start + 50):
+                reopened.add('Concurrent %03d' % i, None, i)
+
+        threads = [threading.Thread(target=writer, args=(i * 50,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        reopened.start_compaction().join()
+        for thread in threads:
+            thread.join()
+        expected = [movie.full_str() for movie in reopened]
+        print('200 adds from 4 threads in', reopened._journal.syncs,
+              'syncs; journal lines after compaction:',
+              len(reopened._journal.lines()))
+        reopened.close()
+        compacted = JournaledMovieLib.open(base, log, balanced=True)
+        print('base is a snapshot:', is_snapshot(base), '; same after compaction:',
+              [movie.full_str() for movie in compacted] == expected)
+        try:
+            compacted.split('M')
+        except RuntimeError as error:
+            print('split:', error)
+        size = compacted.size()
+        for title in ('A\tB', 'C\rD'):
+            try:
+                compacted.add(title, None, 90)
+            except ValueError as error:
+                print('add:', error)
+        unchanged = compacted.size() == size
+        compacted.close()
+        compacted = JournaledMovieLib.open(base, log, balanced=True)
+        print('size unchanged:', unchanged,
+              '; and after reopening:', compacted.size() == size)
+        compacted.close()
+
+        text = os.path.join(folder, 'movies.txt')
+        with open(MOVIES, 'rb') as source, open(text, 'wb') as file:
+            file.write(source.read())
+        textlog = os.path.join(folder, 'text.journal')
+        try:
+            JournaledMovieLib.open(text, textlog)
+        except ValueError as error:
+            print('movie file base with nowhere to compact:', error)
+        snap = os.path.join(folder, 'text.snap')
+        library = JournaledMovieLib.open(text, textlog, compact_to=snap)
+        library.remove('Star Wars')
+        library.compact()
+        library.add('Wonder Boys', '03/05/2000', 107)
+        expected = [movie.full_str() for movie in library]
+        library.close()
+        with open(MOVIES, 'rb') as source, open(text, 'rb') as file:
+            untouched = source.read() == file.read()
+        library = JournaledMovieLib.open(text, textlog, compact_to=snap)
+        print('movie file untouched:', untouched, '; compacted into a snapshot:',
+              is_snapshot(snap), '; same after reopening:',
+              [movie.full_str() for movie in library] == expected)
+        library.close()
+        return compacted
+
+
+if __name__ == '__main__':
+    JournaledMovieLib._test()
@@ -1,18 +1,41 @@
 #author Karim Ulmann
 
 
+import argparse
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
 from functools import total_ordering
+from itertools import islice
 
 
 @total_ordering
 class Movie:
-    """ Represents a single Movie. """
+    """ Represents a single Movie.
+
+    To keep a large catalogue small, the fields live in slots rather than a
+    per-instance __dict__, the release date is stored as a date ordinal
+    (see datetime.date.toordinal) and the running time as an int number of
+    minutes.  Either may be None if unknown.
+    """
+
+    __slots__ = ('_title', '_date', '_time')
 
     def __init__(self, i_title, i_date=None, i_runtime=None):
-        """ Initialise a Movie Object. """
+        """ Initialise a Movie Object.
+
+        Args:
+            i_title - the title of the movie
+            i_date - a datetime.date, a 'dd/mm/yyyy' string, a date ordinal,
+                or None
+            i_runtime - the running time in minutes, as an int or a string,
+                or None
+        """
         self._title = i_title
-        self._date = i_date
-        self._time = i_runtime
+        self._date = _date_ordinal(i_date)
+        self._time = _minutes(i_runtime)
 
     def __str__(self):
         """ Return a short string representation of this movie. """
@@ -21,8 +44,11 @@ class Movie:
 
     def full_str(self):
         """ Return a full string representation of this movie. """
+        date = self.get_date()
+        if date is not None:
+            date = date.strftime('%d/%m/%Y')
         outstr = self._title + ": "
-        outstr = outstr + str(self._date) + "; "
+        outstr = outstr + str(date) + "; "
         outstr = outstr + str(self._time)
         return outstr
 
@@ -30,6 +56,22 @@ class Movie:
         """ Return the title of this movie. """
         return self._title
 
+    def get_date(self):
+        """ Return the release date of this movie as a datetime.date, or
+        None.
+        """
+        if self._date is None:
+            return None
+        return datetime.date.fromordinal(self._date)
+
+    def get_runtime(self):
+        """ Return the running time of this movie in minutes, or None. """
+        return self._time
+
+    def sort_key(self):
+        """ Return the value movies are ordered by (the title). """
+        return self._title
+
     def __eq__(self, other):
         """ Return True if this movie has exactly same title as other. """
         if (other._title == self._title):
@@ -50,48 +92,708 @@ class Movie:
         return False
 
 
-from bst import BSTNode
+def _release(movie):
+    """ Return the value editions of a title are ordered by: the date
+    ordinal, with unknown dates first.
+    """
+    if movie._date is None:
+        return 0
+    return movie._date
+
+
+class Editions(tuple):
+    """ All the movies in a library that share one title (re-releases,
+    remakes, ...), as a tuple in order of release.
+
+    A library's tree holds one Editions per title.  An Editions is never
+    changed once made: adding or removing an edition makes a new one, which
+    the library puts into the tree in place of the old, so a pinned
+    snapshot of a persistent library keeps the editions it had.  It is a
+    bare tuple, with no fields of its own, to keep the cost of the common
+    single-edition title small.  Like movies, Editions are ordered by title.
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        """ Return the title. """
+        return self[0]._title
+
+    def sort_key(self):
+        """ Return the value Editions are ordered by (the title). """
+        return self[0]._title
+
+    def __eq__(self, other):
+        """ Return True if these are editions of the same title as other. """
+        return self.sort_key() == other.sort_key()
+
+    def __ne__(self, other):
+        """ Return False if these are editions of the same title as other. """
+        return self.sort_key() != other.sort_key()
+
+    def __lt__(self, other):
+        """ Return True if these editions are ordered before other. """
+        return self.sort_key() < other.sort_key()
+
+    def __le__(self, other):
+        """ Return True if these editions are not ordered after other. """
+        return self.sort_key() <= other.sort_key()
+
+    def __gt__(self, other):
+        """ Return True if these editions are ordered after other. """
+        return self.sort_key() > other.sort_key()
+
+    def __ge__(self, other):
+        """ Return True if these editions are not ordered before other. """
+        return self.sort_key() >= other.sort_key()
+
+    def __hash__(self):
+        """ Return a hash of the title, in keeping with __eq__. """
+        return hash(self.sort_key())
+
+    def first(self):
+        """ Return the earliest edition. """
+        return self[0]
+
+    def find(self, year):
+        """ Return the (earliest) edition released in year, or None.
+
+        year may instead be a full release date (a datetime.date or a
+        'dd/mm/yyyy' string), to pick out one of several editions released
+        in the same year.
+        """
+        if not isinstance(year, int):
+            date = _date_ordinal(year)
+            for movie in self:
+                if movie._date == date:
+                    return movie
+            return None
+        for movie in self:
+            date = movie.get_date()
+            if date is not None and date.year == year:
+                return movie
+        return None
+
+    def with_movie(self, movie):
+        """ Return new Editions with movie added in order of release, or
+        None if there is already an edition released on the same date.
+        """
+        release = _release(movie)
+        i = 0
+        while i < len(self) and _release(self[i]) < release:
+            i += 1
+        if i < len(self) and _release(self[i]) == release:
+            return None
+        return Editions(self[:i] + (movie,) + self[i:])
+
+    def without(self, movie):
+        """ Return new Editions with movie taken out, or None if it was the
+        only edition.
+        """
+        movies = [other for other in self if other is not movie]
+        if not movies:
+            return None
+        return Editions(movies)
+
+
+def _first(editions):
+    """ Return the earliest Movie of editions, or None if it is None. """
+    return editions.first() if editions is not None else None
+
+
+def _movies(editions):
+    """ Yield every movie from an iterable of Editions, in order. """
+    for titled in editions:
+        yield from titled
+
+
+def _editions_from_record(title, records):
+    """ Return the Editions for title with a Movie per (date, runtime). """
+    return Editions([Movie(title, date, runtime) for date, runtime in records])
+
+
+def _diff_editions(old, new):
+    """ Yield the changes (see MovieLib.diff) between two Editions of the
+    same title.
+    """
+    if old is new:
+        return  # shared by both libraries (e.g. after snapshot): unchanged
+    removed = []
+    added = []
+    i = j = 0
+    while i < len(old) or j < len(new):
+        if j == len(new) or (i < len(old)
+                             and _release(old[i]) < _release(new[j])):
+            removed.append(old[i])
+            i += 1
+        elif i == len(old) or _release(new[j]) < _release(old[i]):
+            added.append(new[j])
+            j += 1
+        else:
+            if old[i]._time != new[j]._time:
+                yield ('change', old[i], new[j])
+            i += 1
+            j += 1
+    for movie, other in zip(removed, added):
+        yield ('change', movie, other)
+    for movie in removed[len(added):]:
+        yield ('remove', movie, None)
+    for movie in added[len(removed):]:
+        yield ('add', None, movie)
+
+
+def check_title(title):
+    """ Return title if it can be written to a change feed.
+
+    Raises ValueError if it holds a tab or a line break (which no title in
+    a movie file can), as the feed line would not read back as written.
+    """
+    if '\t' in title or '\n' in title or '\r' in title:
+        raise ValueError('a tab or line break cannot be written to a change'
+                         ' feed: ' + repr(title))
+    return title
+
+
+def _change_line(op, movie):
+    """ Return the change feed line for op ('+' or '-') on movie. """
+    date = movie.get_date()
+    return '%s\t%s\t%s\t%s\n' % (op, check_title(movie._title),
+                                  date.strftime('%d/%m/%Y') if date else '',
+                                  '' if movie._time is None else movie._time)
+
+
+def delta_lines(changes):
+    """ Yield the lines of a change feed (see MovieLib.apply_delta) for the
+    changes yielded by MovieLib.diff.
+
+    Raises ValueError on a movie whose title cannot be written (see
+    check_title).
+    """
+    for kind, old, new in changes:
+        if old is not None:
+            yield _change_line('-', old)
+        if new is not None:
+            yield _change_line('+', new)
+
+
+def parse_change(line):
+    """ Return a typed (op, title, date, runtime) tuple for one line of a
+    change feed, or None if the line is malformed.
+
+    The op is '+' or '-'; the rest is as for parse_record, except that the
+    date is a date ordinal and may be empty (unknown), as may the runtime.
+    """
+    fields = line.rstrip('\r\n').split('\t')
+    if len(fields) != 4 or fields[0] not in ('+', '-') or not fields[1]:
+        return None
+    op, title, datestr, runtimestr = fields
+    try:
+        date = _date_ordinal(datestr)
+        runtime = _minutes(runtimestr)
+    except ValueError:
+        return None
+    return (op, title, date, runtime)
+
+
+def parse_date(datestr):
+    """ Return the datetime.date for a 'dd/mm/yyyy' string.
+
+    Raises ValueError if datestr is not a valid date in that form.
+    """
+    day, month, year = datestr.split('/')
+    return datetime.date(int(year), int(month), int(day))
+
+
+def _date_ordinal(date):
+    """ Return the date ordinal for a date given in any form Movie accepts. """
+    if date is None or isinstance(date, int):
+        return date
+    if isinstance(date, str):
+        if not date:
+            return None
+        date = parse_date(date)
+    return date.toordinal()
+
+
+def _minutes(runtime):
+    """ Return a running time given as an int or a string as an int. """
+    if runtime is None or isinstance(runtime, int):
+        return runtime
+    if not runtime.strip():
+        return None
+    return int(runtime)
+
+
+def parse_record(line):
+    """ Return a typed (title, date, runtime) tuple for one line of a movie
+    file, or None if the line is malformed.
+
+    Lines are tab-separated: title, release date as dd/mm/yyyy, and running
+    time in minutes.  The date becomes a datetime.date and the runtime an
+    int, or None if the runtime is missing.
+    """
+    fields = line.rstrip('\r\n').split('\t')
+    if len(fields) != 3 or not fields[0]:
+        return None
+    title, datestr, runtimestr = fields
+    try:
+        date = parse_date(datestr)
+        if runtimestr:
+            runtime = int(runtimestr)
+        else:
+            runtime = None
+    except ValueError:
+        return None
+    return (title, date, runtime)
+
+
+class MovieReader:
+    """ Streams typed movie records from a tab-separated movie file.
+
+    The file is read a chunk of lines at a time and each line is parsed with
+    parse_record.  Iterating yields the (title, date, runtime) tuples one at
+    a time; malformed lines are skipped and counted.  A leading byte order
+    mark (as in movies.txt) is dropped.
+    """
+
+    def __init__(self, filename, chunksize=1 << 16):
+        """ Initialise a reader.
+
+        Args:
+            filename - the movie file to read
+            chunksize - roughly how many bytes of lines to read at once
+        """
+        self.filename = filename
+        self.chunksize = chunksize
+        self.lines = 0
+        self.errors = 0
+
+    def __iter__(self):
+        """ Yield the records in the file, in file order. """
+        for chunk in self.chunks():
+            yield from chunk
+
+    def chunks(self):
+        """ Yield lists of the records parsed from each chunk of the file.
+
+        Updates the lines and errors counts as it goes.
+        """
+        with open(self.filename, encoding="utf-8-sig") as file:
+            while True:
+                lines = file.readlines(self.chunksize)
+                if not lines:
+                    return
+                records = [parse_record(line) for line in lines]
+                self.lines += len(lines)
+                if None in records:
+                    records = [record for record in records if record is not None]
+                    self.errors += len(lines) - len(records)
+                yield records
+
+
+from bst import BSTNode, AVLNode
+from arraybst import ArrayBST, ArrayAVL
+from snapshot import SnapshotTree, is_snapshot, write_snapshot
+from persistent import PersistentTree
+from indexes import SecondaryIndex, release_key, runtime_key
+
+
+DATADIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _datafile(name):
+    """ Return the path of a data file shipped alongside this module. """
+    return os.path.join(DATADIR, name)
+
+
+MOVIES = _datafile('movies.txt')
+
+# the secondary indexes a library can keep, by name
+INDEXES = {
+    'date': release_key,
+    'runtime': runtime_key,
+}
 
 
 class MovieLib:
     """ A movie library.
 
     Implemented using a BST. 
+
+    Several movies may share a title (re-releases, remakes): the tree
+    holds one Editions per title, and each edition is kept.  Positions in
+    the catalogue (rank, select, page) count titles, not movies.
     """
 
-    def __init__(self):
-        """ Initialise a movie library. """
+    def __init__(self, balanced=False, arrays=False, persistent=False,
+                 indexes=(), hashed=False):
+        """ Initialise a movie library.
+
+        Args:
+            balanced - if True, keep the titles in a self-balancing (AVL)
+                tree, so the height stays O(log n) whatever order the
+                movies are added in
+            arrays - if True, hold the tree in parallel arrays (ArrayBST)
+                rather than as linked BSTNode objects
+            persistent - if True, hold the titles in a persistent AVL tree
+                (PersistentTree), where each add or remove makes a new
+                version and readers never see a half-made change
+            indexes - the names of the secondary indexes to keep (see
+                INDEXES): 'date' speeds up released_between, and
+                'runtime' runtime_between
+            hashed - if True, also keep a dict from title to editions, so
+                exact-title lookups cost O(1) rather than a descent of the
+                tree (which is still used for every ordered query)
+
+        Raises ValueError for an unknown index name.
+        """
         self.bst = None
+        self._count = 0  # movies, over all the editions; None if not known
+        if persistent:
+            self._nodeclass = PersistentTree
+            self._indexclass = PersistentTree
+        elif arrays:
+            self._nodeclass = ArrayAVL if balanced else ArrayBST
+            self._indexclass = ArrayAVL
+        elif balanced:
+            self._nodeclass = AVLNode
+            self._indexclass = AVLNode
+        else:
+            self._nodeclass = BSTNode
+            self._indexclass = AVLNode  # movie files come in date order
+        for name in indexes:
+            if name not in INDEXES:
+                raise ValueError('unknown index ' + repr(name))
+        # name -> SecondaryIndex, or None until the index is first used
+        self._indexes = dict.fromkeys(indexes)
+        self._hashed = hashed
+        self._titleindex = None  # title -> Editions, once built if hashed
+
+    @classmethod
+    def from_records(cls, records, balanced=False, arrays=False,
+                     persistent=False, indexes=(), hashed=False):
+        """ Return a new library holding the movies in records.
+
+        Args:
+            records - an iterable of (title, date, runtime) tuples
+            balanced, arrays, persistent, indexes, hashed - as for MovieLib()
+
+        The movies are sorted and grouped into editions once (of records
+        with the same title and release date the first wins, as it would
+        with add) and the tree is then built directly from the sorted list,
+        so it is height-optimal.
+        """
+        library = cls(balanced, arrays, persistent, indexes, hashed)
+        movies = [Movie(title, date, runtime) for title, date, runtime in records]
+        # stable, so the first record of a title and date stays first
+        movies.sort(key=lambda movie: (movie._title, _release(movie)))
+        groups = []
+        for movie in movies:
+            if not groups or groups[-1][-1]._title != movie._title:
+                groups.append([movie])
+            elif _release(groups[-1][-1]) != _release(movie):
+                groups[-1].append(movie)
+        editions = [Editions(group) for group in groups]
+        library.bst = library._nodeclass.from_sorted(editions)
+        if hashed:
+            library._titleindex = {titled.sort_key(): titled
+                                   for titled in editions}
+        library._count = sum([len(group) for group in groups])
+        return library
 
     def __str__(self):
         """ Return a string representation of the library.
 
         The string will be created by an in-order traversal.
         """
-        if self.bst is not None:
-            return self.bst.__str__()
+        bst = self.bst
+        if bst is not None:
+            return ''.join([' ' + str(movie) + ',' for movie in _movies(bst)])
         else:
             return None
 
+    def __iter__(self):
+        """ Yield the movies in the library, in alphabetical order (and the
+        editions of a title in order of release).
+        """
+        bst = self.bst
+        if bst is None:
+            return iter(())
+        return _movies(bst)
+
+    def _titled(self):
+        """ Return an iterator over the Editions of each title, in order. """
+        bst = self.bst
+        if bst is None:
+            return iter(())
+        return iter(bst)
+
+    def range(self, lo=None, hi=None):
+        """ Yield, in alphabetical order, the movies with lo <= title < hi.
+
+        Either bound may be None to leave that end open.  Only the matching
+        part of the tree is visited.
+        """
+        bst = self.bst
+        if bst is None:
+            return iter(())
+        return _movies(bst.range(lo, hi))
+
+    def prefix(self, start):
+        """ Yield, in alphabetical order, the movies whose title starts with
+        start (e.g. for autocompletion).
+        """
+        bst = self.bst
+        if bst is None:
+            return iter(())
+        return _movies(bst.prefix(start))
+
     def size(self):
         """ Return the number of movies in the library. """
-        return self.bst.size()
+        if self._count is None:
+            # after a split: count the editions once
+            bst = self.bst
+            self._count = (0 if bst is None else
+                           sum([len(editions) for editions in bst]))
+        return self._count
+
+    def _recount(self, change):
+        """ Adjust the number of movies by change, if it is known. """
+        if self._count is not None:
+            self._count += change
+
+    def titles(self):
+        """ Return the number of distinct titles in the library. """
+        bst = self.bst
+        if bst is None:
+            return 0
+        return bst.size()
+
+    def height(self):
+        """ Return the height of the tree holding the library (-1 if empty). """
+        bst = self.bst
+        if bst is None:
+            return -1
+        return bst.height()
 
-    def search(self, title):
-        """ Return Movie with matching title if there, or None.
+    def released_between(self, first=None, last=None):
+        """ Yield, in order of release, the movies released from first to
+        last (inclusive).
+
+        Args:
+            first, last - dates in any form Movie accepts, or None to leave
+                that end open
+
+        With a 'date' index this costs a descent plus a step per movie;
+        without one, the whole library is scanned and sorted.  Movies with
+        no known date are never included.
+        """
+        return self._between('date', _date_ordinal(first), _date_ordinal(last))
+
+    def runtime_between(self, shortest=None, longest=None):
+        """ Yield, in order of running time, the movies from shortest to
+        longest minutes long (inclusive).
+
+        Either bound may be None to leave that end open.  With a 'runtime'
+        index this costs a descent plus a step per movie; without one, the
+        whole library is scanned and sorted.  Movies with no known running
+        time are never included.
+        """
+        return self._between('runtime', shortest, longest)
+
+    def _between(self, name, first, last):
+        """ Yield the movies whose key in the index name starts with a value
+        from first to last (inclusive), in key order.
+        """
+        lo = None if first is None else (first,)
+        hi = None if last is None else (last + 1,)
+        index = self._index(name)
+        if index is not None:
+            return index.between(lo, hi)
+        keyfunc = INDEXES[name]
+        keyed = []
+        for movie in self:
+            key = keyfunc(movie)
+            if (key is not None and (lo is None or key >= lo)
+                    and (hi is None or key < hi)):
+                keyed.append((key, movie))
+        keyed.sort(key=lambda pair: pair[0])
+        return iter([movie for key, movie in keyed])
+
+    def _index(self, name):
+        """ Return the secondary index name, building it if this is its first
+        use, or None if the library does not keep it.
+        """
+        if name not in self._indexes:
+            return None
+        index = self._indexes[name]
+        if index is None:
+            index = SecondaryIndex.build(INDEXES[name], self._indexclass, self)
+            self._indexes[name] = index
+        return index
+
+    def rank(self, title):
+        """ Return the number of titles in the library ordered before title.
+
+        If title is in the library this is its (0-based) position in the
+        alphabetical catalogue.
+
+        Args:
+            title: a string representing a movie title.
+        """
+        bst = self.bst
+        if bst is None:
+            return 0
+        return bst.rank(title)
+
+    def select(self, k):
+        """ Return the (earliest) Movie with the title at (0-based) position
+        k in the alphabetical catalogue, or None if there is no such
+        position.
+        """
+        bst = self.bst
+        if bst is None:
+            return None
+        editions = bst.select(k)
+        if editions is None:
+            return None
+        return editions.first()
+
+    def page(self, offset, limit):
+        """ Return a list of the Movies, in alphabetical order, with the
+        up to limit titles starting at (0-based) position offset in the
+        catalogue: every edition of each of those titles.
+
+        Both offset and limit count titles, so paging on with
+        offset += limit visits every title once.  Costs one descent to find
+        the first title and then a step to each following one, rather than
+        a walk of the whole catalogue.
+        """
+        bst = self.bst
+        if bst is None or limit <= 0:
+            return []
+        return list(_movies(islice(bst.elements_from(offset), limit)))
+
+    def lookup(self, title, year=None):
+        """ Return the Movie with matching title if there, or None.
+
+        Walks the tree once, comparing the title string directly against
+        each node's sort_key(), so no Movie is built for the query (or, in
+        a hashed library, just looks the title up in a dict).
+
+        Args:
+            title: a string representing a movie title.
+            year: if given, the year the edition wanted was released in
+                (the earliest that year is returned), or its full release
+                date (a datetime.date or a 'dd/mm/yyyy' string); otherwise
+                the earliest edition is returned.
+        """
+        editions = self._find(title)
+        if editions is None:
+            return None
+        if year is None:
+            return editions.first()
+        return editions.find(year)
+
+    def editions(self, title):
+        """ Return a list of every Movie with matching title, in order of
+        release (empty if there are none).
+        """
+        editions = self._find(title)
+        if editions is None:
+            return []
+        return list(editions)
+
+    def _find(self, title):
+        """ Return the Editions of title, or None. """
+        if self._hashed:
+            return self._hash().get(title)
+        # self.bst is read just once, as a lock-free reader of a persistent
+        # library may find it emptied (None) by a writer at any moment
+        bst = self.bst
+        if bst is None:
+            return None
+        return bst.find(title)
+
+    def _hash(self):
+        """ Return the dict from title to Editions, building it if this is
+        its first use.
+        """
+        index = self._titleindex
+        if index is None:
+            # built aside and then published whole, so a reader sharing the
+            # library never sees it half-filled
+            index = {}
+            bst = self.bst
+            if bst is not None:
+                for editions in bst:
+                    index[editions.sort_key()] = editions
+            self._titleindex = index
+        return index
+
+    def _rehash(self, title, editions):
+        """ Record editions (None if there are none now) as those of title
+        in the dict from title to Editions, if it has been built.
+        """
+        if self._titleindex is not None:
+            if editions is None:
+                del self._titleindex[title]
+            else:
+                self._titleindex[title] = editions
+
+    def lookup_many(self, titles):
+        """ Return a dict mapping each of titles to its (earliest) Movie, or
+        None.
+
+        A batch of more than about one title in every height() of the tree
+        is sorted and looked up in one in-order finger search (see
+        TreeWalks.find_many), which costs less than a descent from the root
+        per title once the titles lie close together.  Smaller batches, and
+        those on a hashed library, are looked up one title at a time.
+        """
+        if self._hashed:
+            index = self._hash()
+            found = {}
+            for title in titles:
+                editions = index.get(title)
+                found[title] = editions.first() if editions is not None else None
+            return found
+        bst = self.bst
+        titles = set(titles)
+        if bst is None:
+            return dict.fromkeys(titles)
+        if len(titles) * bst.height() < bst.size():
+            return {title: _first(bst.find(title)) for title in titles}
+        keys = sorted(titles)
+        return {key: _first(editions)
+                for key, editions in zip(keys, bst.find_many(keys))}
+
+    def search_many(self, titles):
+        """ Return a list holding, for each of titles in turn, the full
+        description of the movie with that title, or None.
+
+        Like calling search for each title, but the titles are looked up
+        together (see lookup_many), which is cheaper for big batches.
+        """
+        found = self.lookup_many(titles)
+        results = []
+        for title in titles:
+            movie = found[title]
+            results.append(movie.full_str() if movie is not None else None)
+        return results
+
+    def search(self, title, year=None):
+        """ Return the full description of the movie with matching title,
+        or None.
 
         Args:
             title: a string representing a movie title.
+            year: as for lookup
         """
-        # method goes here
-        # Note that the BST requires an object to search for, and we don't
-        # necessarily know the details of the movie we are looking for except
-        # its title. But Movie objects are compared only on their titles (see
-        # the __eq__ method above in teh Movie class).
-        # Create a new Movie object with that title, and ise that to search 
-        # search the BST.
-        searcher = Movie(title, None, None)
-        return self.bst.search(searcher)
+        movie = self.lookup(title, year)
+        if movie is None:
+            return None
+        return movie.full_str()
 
     def add(self, title, date, runtime):
         """ Add a new move to the library.
@@ -102,16 +804,32 @@ class MovieLib:
             runtime - the running time of the movie
 
         Returns:
-            the movie file that was added, or None
+            the movie file that was added, or None if there already was a
+            movie with the same title and release date
+
+        A movie whose title is already there is added as another edition.
         """
         # method body goes here
         newMovie = Movie(title, date, runtime)
+        newEditions = Editions((newMovie,))
+        self._thaw()
         if self.bst is not None:
-            return self.bst.add(newMovie)
+            if self.bst.add(newEditions) is None:
+                # the title is there: add newMovie to its editions
+                newEditions = self._find(title).with_movie(newMovie)
+                if newEditions is None:
+                    return None
+                self.bst.replace(newEditions)
+            self.bst = self.bst.root()  # rebalancing may have moved the root
         else:
-            root = BSTNode(newMovie)  # create a new object Node with newMovie as the root
+            root = self._nodeclass(newEditions)  # create a new object Node with newMovie as the root
             self.bst = root
-            return newMovie
+        self._rehash(title, newEditions)
+        self._recount(1)
+        for index in self._indexes.values():
+            if index is not None:
+                index.add(newMovie)
+        return newMovie
         # you need to create the Movie object, then add it to the BST,
         # give str of title if not none
         # else none
@@ -119,14 +837,322 @@ class MovieLib:
         # return here.
         # Remember to handle the case where the bst is empty.
 
-    def remove(self, title):
+    def remove(self, title, year=None):
         """ Remove and return the a movie object with the given title, if there.
 
         Args:
             title - the title of the movie to be removed
+            year - if given, only the edition released in that year (the
+                earliest that year), or on that full release date (as for
+                lookup), is removed; otherwise every edition of the title
+                is, and the earliest is returned
+        """
+        removed = self._remove(title, year)
+        if not removed:
+            return None
+        return removed[0]
+
+    def _remove(self, title, year=None):
+        """ Remove the editions of title that remove(title, year) would, and
+        return a list of them.
+        """
+        if self.bst is None:
+            return []
+        if year is None:
+            return self._remove_title(title)
+        editions = self._find(title)
+        if editions is None:
+            return []
+        movie = editions.find(year)
+        if movie is None:
+            return []
+        return self._remove_edition(editions, movie)
+
+    def _remove_edition(self, editions, movie):
+        """ Remove movie, one of editions (the library's editions of its
+        title), and return [movie].
+        """
+        title = editions.sort_key()
+        editions = editions.without(movie)
+        if editions is None:
+            return self._remove_title(title)
+        # other editions remain: keep the title
+        self._thaw()
+        self.bst.replace(editions)
+        self._rehash(title, editions)
+        self._recount(-1)
+        self._unindex([movie])
+        return [movie]
+
+    def _remove_title(self, title):
+        """ Remove every edition of title, and return a list of them. """
+        if self.bst is None:
+            return []
+        if isinstance(self.bst, SnapshotTree) and self._find(title) is None:
+            return []  # no need to thaw
+        self._thaw()
+        # one descent, which also finds the new root if the root goes
+        self.bst, editions = self.bst.delete(title)
+        if editions is None:
+            return []
+        removed = list(editions)
+        self._rehash(title, None)
+        self._recount(-len(removed))
+        self._unindex(removed)
+        return removed
+
+    def _unindex(self, movies):
+        """ Take movies out of the secondary indexes built so far. """
+        for index in self._indexes.values():
+            if index is not None:
+                for movie in movies:
+                    index.remove(movie)
+
+    def apply_batch(self, adds=(), removes=()):
+        """ Apply a batch of changes to the library.
+
+        Args:
+            adds - an iterable of (title, date, runtime) tuples to add
+            removes - an iterable of titles to remove (with all their
+                editions)
+
+        The removes are made first, so a title in both is replaced.
+
+        Returns:
+            (added, removed): lists of the movies actually added and removed
+        """
+        removed = []
+        for title in removes:
+            removed.extend(self._remove(title))
+        added = []
+        for title, date, runtime in adds:
+            movie = self.add(title, date, runtime)
+            if movie is not None:
+                added.append(movie)
+        return added, removed
+
+    def diff(self, other):
+        """ Yield the changes that would turn this library into other, in
+        alphabetical order, as (kind, old, new) tuples:
+
+            ('add', None, movie) - movie is only in other
+            ('remove', movie, None) - movie is only in this library
+            ('change', movie, new) - the edition movie has a different
+                release date or running time in other
+
+        Both libraries are walked in order side by side, so this costs
+        O(n + m) and builds no intermediate lists.  Editions of a title are
+        matched by release date; any left unmatched on both sides are
+        paired up in order as changes of date.
+        """
+        mine = self._titled()
+        theirs = other._titled()
+        old = next(mine, None)
+        new = next(theirs, None)
+        while old is not None or new is not None:
+            if new is None or (old is not None and old < new):
+                for movie in old:
+                    yield ('remove', movie, None)
+                old = next(mine, None)
+            elif old is None or new < old:
+                for movie in new:
+                    yield ('add', None, movie)
+                new = next(theirs, None)
+            else:
+                yield from _diff_editions(old, new)
+                old = next(mine, None)
+                new = next(theirs, None)
+
+    def apply_delta(self, stream):
+        """ Apply a change feed to the library.
+
+        Args:
+            stream - an iterable of lines (e.g. an open file), each a movie
+                record as in a movie file, preceded by '+' to add it or '-'
+                to remove the edition of its title released on its date,
+                and a tab.  A change of date or running time is a '-' line
+                for the old record followed by a '+' line for the new.
+                delta_lines writes such a feed from diff.
+
+        Only the titles named in the feed are touched.  Malformed lines, and
+        removes of editions that are not there, are skipped.
+
+        Returns:
+            (added, removed): lists of the movies actually added and removed
+        """
+        added = []
+        removed = []
+        for line in stream:
+            change = parse_change(line)
+            if change is None:
+                continue
+            op, title, date, runtime = change
+            if op == '+':
+                movie = self.add(title, date, runtime)
+                if movie is not None:
+                    added.append(movie)
+                continue
+            editions = self._find(title)
+            if editions is None:
+                continue
+            for movie in editions:
+                if movie._date == date:
+                    removed.extend(self._remove_edition(editions, movie))
+                    break
+        return added, removed
+
+    def save(self, path):
+        """ Write a binary snapshot of the library to path.
+
+        See the snapshot module for the format.  MovieLib.load maps it back.
+        """
+        write_snapshot(path, [(editions.sort_key(),
+                               [(movie._date, movie._time) for movie in editions])
+                              for editions in self._titled()])
+
+    @classmethod
+    def load(cls, path, balanced=False, arrays=False, indexes=(),
+             hashed=False):
+        """ Return a library backed by the snapshot at path.
+
+        The file is memory-mapped and searched in place, so loading is quick
+        whatever its size and Movie objects are only built for the results
+        of queries.  The first add or remove copies the catalogue into an
+        ordinary tree (as chosen by balanced and arrays, see MovieLib()).
+        Any secondary indexes are built when first used; the dict from
+        title to editions of a hashed library is built here, which costs a
+        walk of the file.
         """
-        newMovie = Movie(title, None, None)
-        return self.bst.remove(newMovie)
+        library = cls(balanced, arrays, indexes=indexes, hashed=hashed)
+        tree = SnapshotTree(path, _editions_from_record)
+        if tree.size() > 0:
+            library.bst = tree
+            library._count = tree.record_count()
+        if hashed:
+            library._hash()
+        return library
+
+    def snapshot(self):
+        """ Return a library holding the movies in this one as they are now,
+        which later changes to this library will not affect.
+
+        For a persistent library this just pins the current version, which
+        costs O(1); for the others the tree is copied.  The copy's indexes
+        (including the dict from title to editions of a hashed library) are
+        not copied but built afresh when it first uses them, as they would
+        be for a newly loaded library.
+        """
+        library = self._empty()
+        library._count = self._count
+        bst = self.bst
+        if isinstance(bst, PersistentTree):
+            library.bst = bst.snapshot()
+        elif bst is not None:
+            # Editions never change, so the copies can share them
+            library.bst = self._nodeclass.from_sorted(list(bst))
+        return library
+
+    def _empty(self):
+        """ Return a new, empty library of the same kind as this one. """
+        library = self.__class__()
+        library._nodeclass = self._nodeclass
+        library._indexclass = self._indexclass
+        library._indexes = dict.fromkeys(self._indexes)  # rebuilt when used
+        library._hashed = self._hashed
+        return library
+
+    def split(self, title):
+        """ Move the movies in this library into two new ones, and return
+        them as (left, right): left holds the titles before title, and
+        right the rest.  This library is left empty.
+
+        The tree is split rather than copied, which costs O(log n) for a
+        balanced or persistent library (O(height) for a plain one; O(n)
+        with arrays, which are rebuilt).  Secondary indexes and the size of
+        each half are worked out again when first needed; the dicts from
+        title to editions of a hashed library are built here, in O(n).
+        """
+        left = self._empty()
+        right = self._empty()
+        if self.bst is not None:
+            self._thaw()
+            left.bst, right.bst = self.bst.split(title)
+            left._count = None if left.bst is not None else 0
+            right._count = None if right.bst is not None else 0
+        self._clear()
+        if self._hashed:
+            left._hash()
+            right._hash()
+        return left, right
+
+    @classmethod
+    def join(cls, left, right):
+        """ Move the movies in the libraries left and right (of the same
+        kind) into a new one, and return it; both are left empty.
+
+        Every title in left must be before every title in right.  Costs
+        O(log n) for balanced or persistent libraries (see split), plus
+        O(n) to merge the dicts from title to editions if hashed.
+
+        Raises ValueError if the titles overlap or the kinds differ.
+        """
+        if left._nodeclass is not right._nodeclass:
+            raise ValueError('cannot join libraries of different kinds')
+        if (left.bst is not None and right.bst is not None
+                and not (left.bst.select(left.titles() - 1).sort_key()
+                         < right.bst.select(0).sort_key())):
+            raise ValueError('the titles of the libraries overlap')
+        library = left._empty()
+        left._thaw()
+        right._thaw()
+        library.bst = left._nodeclass.join(left.bst, right.bst)
+        if left._count is not None and right._count is not None:
+            library._count = left._count + right._count
+        else:
+            library._count = None if library.bst is not None else 0
+        if library._hashed:
+            index = dict(left._hash())
+            index.update(right._hash())
+            library._titleindex = index
+        left._clear()
+        right._clear()
+        return library
+
+    def remove_range(self, lo=None, hi=None):
+        """ Remove every movie with lo <= title < hi, and return a list of
+        them, in order.
+
+        Either bound may be None to leave that end open.  The range is cut
+        out of the tree in one piece, which costs O(log n) for a balanced
+        or persistent library, plus O(k) to list the k movies removed (and
+        take them out of any secondary indexes).
+        """
+        if self.bst is None:
+            return []
+        self._thaw()
+        self.bst, removed = self.bst.remove_range(lo, hi)
+        if removed is None:
+            return []
+        movies = list(_movies(removed))
+        if self._titleindex is not None:
+            for editions in removed:
+                del self._titleindex[editions.sort_key()]
+        self._recount(-len(movies))
+        self._unindex(movies)
+        return movies
+
+    def _clear(self):
+        """ Empty the library, after its tree has been given away. """
+        self.bst = None
+        self._count = 0
+        self._indexes = dict.fromkeys(self._indexes)
+        if self._titleindex is not None:
+            self._titleindex = {}
+
+    def _thaw(self):
+        """ Replace a read-only snapshot tree with a writable copy. """
+        if isinstance(self.bst, SnapshotTree):
+            self.bst = self._nodeclass.from_sorted(list(self.bst))
 
     def _testadd():
         library = MovieLib()
@@ -148,38 +1174,38 @@ class MovieLib:
 
     def _test():
         library = MovieLib()
-        library.add("B", "b", 1)
+        library.add("B", None, 1)
         print('Library:', library)
         print('adding', "A")
-        library.add("A", "a", 1)
+        library.add("A", None, 1)
         print('Library:', library)
         print('removing', "A")
         print(library.bst._properBST())
         library.remove("A")
         print('Library:', library)
         print('adding', "C")
-        library.add("C", "c", 1)
+        library.add("C", None, 1)
         print('Library:', library)
         print('removing', "C")
         library.remove("C")
         print('Library:', library)
         print('adding', "F")
-        library.add("F", "f", 1)
+        library.add("F", None, 1)
         print('Library:', library)
         print('removing', "B")
         library.remove("B")
         print('Library:', library)
         print('adding', "C")
-        library.add("C", "c", 1)
+        library.add("C", None, 1)
         print('Library:', library)
         print('adding', "D")
-        library.add("D", "d", 1)
+        library.add("D", None, 1)
         print('Library:', library)
         print('adding', "C")
-        library.add("C", "c", 1)
+        library.add("C", None, 1)
         print('Library:', library)
         print('adding', "E")
-        library.add("E", "e", 1)
+        library.add("E", None, 1)
         print('Library:', library)
         print('removing', "B")
         library.remove("B")
@@ -194,16 +1220,16 @@ class MovieLib:
         library.remove("E")
         print('Library:', library)
         print('adding', "L")
-        library.add("L", "l", 1)
+        library.add("L", None, 1)
         print('Library:', library)
         print('adding', "H")
-        library.add("H", "h", 1)
+        library.add("H", None, 1)
         print('Library:', library)
         print('adding', "I")
-        library.add("I", "i", 1)
+        library.add("I", None, 1)
         print('Library:', library)
         print('adding', "G")
-        library.add("G", "g", 1)
+        library.add("G", None, 1)
         print('Library:', library)
         print('removing', "L")
         library.remove("L")
@@ -219,29 +1245,84 @@ class MovieLib:
         print('Library:', library)
 
 
-def build_library(filename):
-    """ Return a library of Movie files built from filename """
+class Catalogue:
+    """ A movie library that is only loaded when it is first used.
+
+    Creating a Catalogue is free; the first query loads the library, from a
+    snapshot if filename is one (see MovieLib.load) or else by bulk-loading
+    the movie file.  Any MovieLib method can then be called on the
+    Catalogue itself.
+    """
+
+    def __init__(self, filename=MOVIES, balanced=False, arrays=False):
+        """ Initialise a catalogue of the movies in filename. """
+        self.filename = filename
+        self._balanced = balanced
+        self._arrays = arrays
+        self._library = None
+
+    def library(self):
+        """ Return the MovieLib, loading it if this is the first use. """
+        if self._library is None:
+            if is_snapshot(self.filename):
+                self._library = MovieLib.load(self.filename, self._balanced,
+                                              self._arrays)
+            else:
+                self._library = build_library(self.filename, self._balanced,
+                                              bulk=True, arrays=self._arrays,
+                                              verbose=False)
+        return self._library
+
+    def loaded(self):
+        """ Return True if the library has been loaded yet. """
+        return self._library is not None
+
+    def __getattr__(self, name):
+        """ Pass any other attribute through to the library. """
+        return getattr(self.library(), name)
+
+    def __iter__(self):
+        """ Yield the movies in the library, in alphabetical order. """
+        return iter(self.library())
+
+    def __str__(self):
+        """ Return a string representation of the library. """
+        return str(self.library())
+
+
+def build_library(filename, balanced=False, bulk=False, arrays=False,
+                  verbose=True):
+    """ Return a library of Movie files built from filename
 
-    # open the file
-    file = open(filename, encoding="utf8")
-    # create the library
-    library = MovieLib()
+    If balanced is True the library uses a self-balancing tree, and if arrays
+    is True the tree is held in parallel arrays.  If bulk is
+    True all the records are read first and the tree is built in one go
+    (see MovieLib.from_records), rather than adding the movies one by one.
+    If verbose is True, some counts are printed for sanity checking.
+    """
 
-    filecount = 0
-    count = 0
+    # stream typed records out of the file
+    reader = MovieReader(filename)
 
-    # now cycle through the  lines in the file, adding the movies to the
-    # library
-    for line in file:
-        filecount += 1
-        inputlist = line.split('\t')
-        added = library.add(inputlist[0], inputlist[1], inputlist[2])
-        if added is not None:
-            count += 1
-            count += 1
+    if bulk:
+        library = MovieLib.from_records(reader, balanced, arrays)
+        count = library.size()
+    else:
+        # create the library
+        library = MovieLib(balanced, arrays)
+        count = 0
+        # now cycle through the records, adding the movies to the library
+        for title, date, runtime in reader:
+            added = library.add(title, date, runtime)
+            if added is not None:
+                count += 1
     # print out some info for sanity checking
-    print("read a file with", filecount, "movies")
-    print("Built a library with", count, "unique movie titles")
+    if verbose:
+        print("read a file with", reader.lines, "movies")
+        if reader.errors:
+            print("skipped", reader.errors, "malformed lines")
+        print("Built a library with", count, "movies under",
+              library.titles(), "titles")
     # print(library.search('Wonder Woman'))
     # print(library.search('Touch of Evil'))
     # print(library.search('Delicatessen'))
@@ -249,20 +1330,129 @@ def build_library(filename):
     return library
 
 
-MovieLib._testadd()
+def _testlibraries():
+    """ Build and check libraries from the sample files (the old script). """
+    MovieLib._testadd()
+
+    print('++++++++++')
+
+    MovieLib._test()
+    build_library(_datafile('smallmovies.txt'))
+
+    print('++++++++++')
+
+    repeat = build_library(_datafile('small_repeated_movies.txt'))
+    print('Wonderland:', [movie.full_str() for movie in repeat.editions('Wonderland')])
+    print('Wonderland (1999):', repeat.search('Wonderland', 1999))
+    print('removed', repeat.remove('Wonderland', 1999).full_str(), ';',
+          repeat.size(), 'movies under', repeat.titles(), 'titles')
+
+    print('++++++++++')
+
+    build_library(MOVIES)
+
+    print('++++++++++')
+
+    balanced = build_library(MOVIES, balanced=True)
+    print(balanced.bst._stats(), '; proper BST:', balanced.bst._properBST())
+    expired = balanced.remove_range('Star Trek', 'Star Wars')
+    left, right = balanced.split('M')
+    balanced = MovieLib.join(left, right)
+    print('expired', len(expired), 'Star Trek movies;', balanced.bst._stats(),
+          '; proper BST:', balanced.bst._properBST(), '; balanced:',
+          balanced.bst._isbalanced())
+
+    print('++++++++++')
+
+    bulk = build_library(MOVIES, bulk=True)
+    print(bulk.bst._stats(), '; proper BST:', bulk.bst._properBST())
+    paged = []
+    for offset in range(0, bulk.titles(), 10):
+        paged.extend(bulk.page(offset, 10))
+    print('paged through in tens:', len(paged), 'movies; same as a walk:',
+          paged == list(bulk) and [movie.full_str() for movie in paged]
+          == [movie.full_str() for movie in bulk])
+
+    print('++++++++++')
+
+    arrays = build_library(MOVIES, balanced=True, arrays=True)
+    print(arrays.bst._stats(), '; proper BST:', arrays.bst._properBST())
+
+    print('++++++++++')
+
+    persistent = MovieLib.from_records(MovieReader(MOVIES), persistent=True)
+    pinned = persistent.snapshot()
+    persistent.remove('Star Wars')
+    print(persistent.bst._stats(), '; proper BST:', persistent.bst._properBST())
+    print('pinned:', pinned.search('Star Wars'), '; current:',
+          persistent.search('Star Wars'))
+    titles = [movie.sort_key() for movie in islice(bulk, 0, None, 3)]
+    titles.append('No Such Film')
+    print('lookup_many, big and small batches, same as lookup:',
+          all([library.lookup_many(batch)
+               == {title: library.lookup(title) for title in batch}
+               for library in (balanced, bulk, arrays, persistent)
+               for batch in (titles, titles[-50:])]))
+
+    print('++++++++++')
+
+    indexed = MovieLib.from_records(MovieReader(MOVIES), balanced=True,
+                                    indexes=('date', 'runtime'), hashed=True)
+    before = len(list(indexed.released_between('01/01/1977', '31/12/1977')))
+    indexed.add('Wonder Boys', '03/05/2000', 107)
+    indexed.remove('Star Wars')
+    released = list(indexed.released_between('01/01/1977', '31/12/1977'))
+    print('released in 1977:', before, 'then', len(released), '; same as a scan:',
+          released == [movie for movie in
+                       bulk.released_between('01/01/1977', '31/12/1977')
+                       if movie.get_title() != 'Star Wars'])
+    print('hashed lookups:', indexed.lookup('Star Wars'),
+          indexed.search('Wonder Boys', 2000))
+    pinned = indexed.snapshot()
+    indexed.add('Star Wars', '25/05/1977', 121)
+    print('hashed snapshot: dict built on first use:',
+          pinned._titleindex is None, '; still without Star Wars:',
+          pinned.lookup('Star Wars') is None and pinned._titleindex is not None)
+    print('Wonder Boys editions between 105 and 110 minutes:',
+          [movie.full_str() for movie in indexed.runtime_between(105, 110)
+           if movie.get_title() == 'Wonder Boys'])
 
-print('++++++++++')
+    print('++++++++++')
 
-MovieLib._test()
-newlibrary = build_library('smallmovies.txt')
+    upstream = MovieLib.from_records(MovieReader(MOVIES), balanced=True)
+    upstream.add('Wonder Boys', '03/05/2000', 107)
+    upstream.remove('Alien')
+    upstream.remove('Star Wars')
+    upstream.add('Star Wars', '25/05/1977', 125)
+    changes = list(bulk.diff(upstream))
+    print('changes:', [(kind, str(old or new)) for kind, old, new in changes])
+    synced = MovieLib.from_records(MovieReader(MOVIES), balanced=True)
+    added, removed = synced.apply_delta(delta_lines(changes))
+    print('added', len(added), 'removed', len(removed), '; in sync:',
+          [movie.full_str() for movie in synced]
+          == [movie.full_str() for movie in upstream],
+          '; no changes left:', not list(synced.diff(upstream)))
+    usher = 'The Fall of the House of Usher'
+    print('1928:', synced.search(usher, 1928), '; 31/12/1928:',
+          synced.search(usher, '31/12/1928'))
+    print('removed:', synced.remove(usher, datetime.date(1928, 12, 31)).full_str(),
+          '; left:', [movie.full_str() for movie in synced.editions(usher)])
 
-print('++++++++++')
+    print('++++++++++')
 
-repeat = build_library('small_repeated_movies.txt')
+    snappath = os.path.join(tempfile.gettempdir(), 'small_repeated_movies.snap')
+    repeat.save(snappath)
+    loaded = MovieLib.load(snappath)
+    print('Loaded:', loaded)
+    print(loaded.search('Wonder Woman'), '; rank:', loaded.rank('Wonder Woman'),
+          '; editions:', len(loaded.editions('Wonder Woman')))
+    loaded.add('Wonder Boys', '03/05/2000', 107)
+    print('After add:', loaded, '; proper BST:', loaded.bst._properBST())
 
-print('++++++++++')
+    print('++++++++++')
+
+    print(numbers_bst())
 
-super = build_library('movies.txt')
 
 def numbers_bst():
     bst = BSTNode(Movie('4', 1, 1))
@@ -276,4 +1466,108 @@ def numbers_bst():
     return bst
 
 
-print(numbers_bst())
+IMPORT_BUDGET = 0.5  # seconds, generous enough for a cold interpreter
+
+
+def _testimport():
+    """ Check that importing movieLib is quick and prints nothing. """
+    code = ('import time; start = time.perf_counter(); import movieLib; '
+            'print(time.perf_counter() - start)')
+    result = subprocess.run([sys.executable, '-c', code], cwd=DATADIR,
+                            capture_output=True, text=True, check=True)
+    output = result.stdout.split()
+    assert len(output) == 1, 'importing movieLib printed ' + result.stdout
+    seconds = float(output[0])
+    assert seconds < IMPORT_BUDGET, 'importing movieLib took %.3fs' % seconds
+    print('import movieLib took %.3fs (budget %.1fs)' % (seconds, IMPORT_BUDGET))
+
+
+def _year_or_date(text):
+    """ Return a --year argument: an int year, or a 'dd/mm/yyyy' string. """
+    if '/' in text:
+        try:
+            parse_date(text)
+        except ValueError:
+            raise argparse.ArgumentTypeError('not a dd/mm/yyyy date: ' + text)
+        return text
+    try:
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError('not a year: ' + text)
+
+
+def main(argv=None):
+    """ Run the command line interface.
+
+        python -m movieLib build [FILE] [--snapshot OUT]
+        python -m movieLib search TITLE... [--year YEAR|DD/MM/YYYY] [--file FILE]
+        python -m movieLib stats [--file FILE]
+        python -m movieLib diff OLD NEW
+        python -m movieLib test
+    """
+    parser = argparse.ArgumentParser(prog='movieLib',
+                                     description='Manage a PyFlix movie library.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='build a library from a movie file')
+    build.add_argument('file', nargs='?', default=MOVIES)
+    build.add_argument('--snapshot', help='also save a binary snapshot here')
+    build.add_argument('--balanced', action='store_true')
+    build.add_argument('--arrays', action='store_true')
+
+    search = commands.add_parser('search', help='look up movies by title')
+    search.add_argument('titles', nargs='+')
+    search.add_argument('--year', type=_year_or_date,
+                        help='only the edition released in this year, or'
+                             ' on this date (dd/mm/yyyy)')
+    search.add_argument('--file', default=MOVIES,
+                        help='movie file or snapshot to search')
+
+    stats = commands.add_parser('stats', help='report size and height')
+    stats.add_argument('--file', default=MOVIES,
+                       help='movie file or snapshot to describe')
+
+    diff = commands.add_parser('diff',
+                               help='write the change feed from one movie file to another')
+    diff.add_argument('old')
+    diff.add_argument('new')
+
+    commands.add_parser('test', help='run the self-tests')
+
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        library = build_library(args.file, args.balanced, bulk=True,
+                                arrays=args.arrays)
+        print(library.bst._stats())
+        if args.snapshot:
+            library.save(args.snapshot)
+            print('saved a snapshot to', args.snapshot)
+    elif args.command == 'search':
+        catalogue = Catalogue(args.file)
+        for title in args.titles:
+            if args.year is not None:
+                found = catalogue.lookup(title, args.year)
+                found = [found] if found is not None else []
+            else:
+                found = catalogue.editions(title)
+            for movie in found:
+                print(movie.full_str())
+            if not found:
+                print(title + ': not found')
+    elif args.command == 'stats':
+        library = Catalogue(args.file).library()
+        print('size = ' + str(library.size())
+              + '; titles = ' + str(library.titles())
+              + '; height = ' + str(library.height()))
+    elif args.command == 'diff':
+        old = Catalogue(args.old).library()
+        new = Catalogue(args.new).library()
+        sys.stdout.writelines(delta_lines(old.diff(new)))
+    else:
+        _testlibraries()
+        print('++++++++++')
+        _testimport()
+
+
+if __name__ == '__main__':
+    main()
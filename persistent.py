@@ -0,0 +1,486 @@
+#author Karim Ulmann
+
+""" A persistent (path-copying) AVL tree.
+
+Nodes are never changed once built.  Adding or removing an item copies
+just the nodes on the path from the root to the change (O(log n) of them)
+and returns a new root; every older root still describes the tree exactly
+as it was.  So a reader holding a root sees a consistent snapshot, however
+many changes a writer makes meanwhile, and needs no locks.
+"""
+
+import threading
+
+from walks import TreeWalks, linked
+
+
+class PersistentNode:
+    """ An immutable node of a persistent AVL tree.
+
+    Besides its element and children, each node caches the element's
+    sort_key() and the size and height of its subtree.  Nodes have no
+    parent link, since that would tie each node to a single version.
+    """
+
+    __slots__ = ('_element', '_key', '_leftchild', '_rightchild',
+                 '_size', '_height')
+
+    def __init__(self, element, key, left=None, right=None):
+        """ Build a node over the (already built) left and right subtrees. """
+        self._element = element
+        self._key = key
+        self._leftchild = left
+        self._rightchild = right
+        self._size = 1 + _size(left) + _size(right)
+        self._height = 1 + max(_height(left), _height(right))
+
+
+def _size(node):
+    """ Return the size of the subtree at node (0 if empty). """
+    if node is None:
+        return 0
+    return node._size
+
+
+def _height(node):
+    """ Return the height of the subtree at node (-1 if empty). """
+    if node is None:
+        return -1
+    return node._height
+
+
+def _balanced(element, key, left, right):
+    """ Return a new node for element over left and right, rotating if the
+    heights of left and right differ by two.
+    """
+    lh = _height(left)
+    rh = _height(right)
+    if lh > rh + 1:
+        if _height(left._leftchild) < _height(left._rightchild):
+            inner = left._rightchild
+            return PersistentNode(
+                inner._element, inner._key,
+                PersistentNode(left._element, left._key,
+                               left._leftchild, inner._leftchild),
+                PersistentNode(element, key, inner._rightchild, right))
+        return PersistentNode(left._element, left._key, left._leftchild,
+                              PersistentNode(element, key,
+                                             left._rightchild, right))
+    if rh > lh + 1:
+        if _height(right._rightchild) < _height(right._leftchild):
+            inner = right._leftchild
+            return PersistentNode(
+                inner._element, inner._key,
+                PersistentNode(element, key, left, inner._leftchild),
+                PersistentNode(right._element, right._key,
+                               inner._rightchild, right._rightchild))
+        return PersistentNode(right._element, right._key,
+                              PersistentNode(element, key,
+                                             left, right._leftchild),
+                              right._rightchild)
+    return PersistentNode(element, key, left, right)
+
+
+def insert(root, obj):
+    """ Return (new root, True) for the tree at root with obj added, or
+    (root, False) if a matching object was already there.
+    """
+    key = obj.sort_key()
+    path = []
+    node = root
+    while node is not None:
+        if key < node._key:
+            path.append((node, True))
+            node = node._leftchild
+        elif key > node._key:
+            path.append((node, False))
+            node = node._rightchild
+        else:
+            return root, False
+    return _rebuild(path, PersistentNode(obj, key)), True
+
+
+def delete(root, key):
+    """ Return (new root, removed element) for the tree at root with the
+    element whose sort_key() == key taken out, or (root, None) if there is
+    no such element.
+    """
+    path = []
+    node = root
+    while node is not None:
+        if key < node._key:
+            path.append((node, True))
+            node = node._leftchild
+        elif key > node._key:
+            path.append((node, False))
+            node = node._rightchild
+        else:
+            break
+    else:
+        return root, None
+    if node._leftchild is None:
+        replacement = node._rightchild
+    elif node._rightchild is None:
+        replacement = node._leftchild
+    else:
+        # take the successor's element, and rebuild the right subtree
+        # without it
+        subpath = []
+        successor = node._rightchild
+        while successor._leftchild is not None:
+            subpath.append((successor, True))
+            successor = successor._leftchild
+        right = _rebuild(subpath, successor._rightchild)
+        replacement = _balanced(successor._element, successor._key,
+                                node._leftchild, right)
+    return _rebuild(path, replacement), node._element
+
+
+def replace(root, obj):
+    """ Return (new root, replaced element) for the tree at root with obj in
+    place of the element with the same sort_key(), or (root, None) if there
+    is no such element.
+    """
+    key = obj.sort_key()
+    path = []
+    node = root
+    while node is not None:
+        if key < node._key:
+            path.append((node, True))
+            node = node._leftchild
+        elif key > node._key:
+            path.append((node, False))
+            node = node._rightchild
+        else:
+            break
+    else:
+        return root, None
+    new = PersistentNode(obj, key, node._leftchild, node._rightchild)
+    return _rebuild(path, new), node._element
+
+
+def join(left, element, key, right):
+    """ Return a new root for the tree of left, then element (with sort key
+    key), then right; every element of left must be before element, and
+    every element of right after it.
+
+    element goes down the inside spine of the taller tree to a subtree about
+    as tall as the other, so this copies O(1 + the difference in heights)
+    nodes.
+    """
+    if _height(left) > _height(right) + 1:
+        return _balanced(left._element, left._key, left._leftchild,
+                         join(left._rightchild, element, key, right))
+    if _height(right) > _height(left) + 1:
+        return _balanced(right._element, right._key,
+                         join(left, element, key, right._leftchild),
+                         right._rightchild)
+    return PersistentNode(element, key, left, right)
+
+
+def split(root, key):
+    """ Return (left, right), new roots for the elements of the tree at root
+    whose sort_key() is before key and for the rest.
+    """
+    if root is None:
+        return None, None
+    if root._key < key:
+        left, right = split(root._rightchild, key)
+        return join(root._leftchild, root._element, root._key, left), right
+    left, right = split(root._leftchild, key)
+    return left, join(right, root._element, root._key, root._rightchild)
+
+
+def _rebuild(path, subtree):
+    """ Copy the (node, went_left) path back up to the root, hanging
+    subtree where the path ended, and return the new root.
+    """
+    for node, went_left in reversed(path):
+        if went_left:
+            subtree = _balanced(node._element, node._key, subtree,
+                                node._rightchild)
+        else:
+            subtree = _balanced(node._element, node._key, node._leftchild,
+                                subtree)
+    return subtree
+
+
+def _build(items, lo, hi):
+    """ Return the root of a balanced subtree holding items[lo:hi]. """
+    if lo >= hi:
+        return None
+    mid = (lo + hi) // 2
+    return PersistentNode(items[mid], items[mid].sort_key(),
+                          _build(items, lo, mid), _build(items, mid + 1, hi))
+
+
+class PersistentTree(TreeWalks):
+    """ A handle on the current version of a persistent AVL tree.
+
+    add and remove build a new version and then switch the handle to it
+    with a single assignment.  Every read method fetches the current
+    version once and works only on that, so reads running alongside a
+    writer each see a consistent tree without taking any lock.  snapshot()
+    returns a handle pinned to the current version.
+
+    It offers the same methods as the BSTNode at the root of a tree, so
+    MovieLib can use it.  Only one thread should write at a time.
+    """
+
+    def __init__(self, item=None):
+        """ Initialise a tree on creation, holding just item (if given). """
+        if item is None:
+            self._root = None
+        else:
+            self._root = PersistentNode(item, item.sort_key())
+
+    @classmethod
+    def from_sorted(cls, items):
+        """ Return a height-optimal tree holding items, or None if empty.
+
+        Args:
+            items: a list of objects in strictly increasing order (sorted and
+                with no duplicates); it is not checked
+        """
+        if not items:
+            return None
+        tree = cls()
+        tree._root = _build(items, 0, len(items))
+        return tree
+
+    def version(self):
+        """ Return the root PersistentNode of the current version. """
+        return self._root
+
+    def snapshot(self):
+        """ Return a new handle on the current version. """
+        tree = self.__class__()
+        tree._root = self._root
+        return tree
+
+    def root(self):
+        """ Return the tree itself (it is its own root). """
+        return self
+
+    def size(self):
+        """ Return the number of elements. """
+        return _size(self._root)
+
+    def height(self):
+        """ Return the height of the tree. """
+        return _height(self._root)
+
+    def _walk(self):
+        """ Return the accessors TreeWalks needs to walk the current version. """
+        return linked(self._root, _size)
+
+    def add(self, obj):
+        """ Add item to the tree, as a new version.
+
+        Returns the item added, or None if a matching object was already there.
+        """
+        root, added = insert(self._root, obj)
+        if not added:
+            return None
+        self._root = root
+        return obj
+
+    def remove(self, searchitem):
+        """ Remove the object matching searchitem, as a new version, and
+        return it (or None if it was not there).
+        """
+        root, removed = delete(self._root, searchitem.sort_key())
+        self._root = root
+        return removed
+
+    def delete(self, key):
+        """ Remove the element whose sort_key() == key, as a new version.
+
+        Returns (root, element) as BSTNode.delete does: the tree itself, or
+        None if it is now empty, and the element removed (or None).
+        """
+        root, removed = delete(self._root, key)
+        self._root = root
+        if root is None:
+            return None, removed
+        return self, removed
+
+    def split(self, key):
+        """ Return (left, right), trees of the elements of the current version
+        whose sort_key() is before key and of the rest (None if empty).
+
+        Costs O(log n), and leaves this tree as it was.
+        """
+        left, right = split(self._root, key)
+        return self._handle(left), self._handle(right)
+
+    @classmethod
+    def join(cls, left, right):
+        """ Return a tree holding the elements of the trees left and right
+        (either may be None), whose elements must all be before those of
+        right; it is not checked.  Costs O(log n), and leaves both as they
+        were.
+        """
+        if left is None:
+            return right
+        if right is None:
+            return left
+        node = left._root
+        while node._rightchild is not None:
+            node = node._rightchild
+        rest = delete(left._root, node._key)[0]
+        tree = cls()
+        tree._root = join(rest, node._element, node._key, right._root)
+        return tree
+
+    def remove_range(self, lo=None, hi=None):
+        """ Remove the elements whose sort_key() k has lo <= k < hi, as a new
+        version.
+
+        Either bound may be None to leave that end open.  Returns (root,
+        removed) as BSTNode.remove_range does: this tree (or None if it is
+        now empty) and a tree of the elements removed (or None).
+        """
+        if lo is None:
+            below, rest = None, self._root
+        else:
+            below, rest = split(self._root, lo)
+        if hi is None:
+            removed, above = rest, None
+        else:
+            removed, above = split(rest, hi)
+        kept = self.join(self._handle(below), self._handle(above))
+        self._root = kept._root if kept is not None else None
+        if self._root is None:
+            return None, self._handle(removed)
+        return self, self._handle(removed)
+
+    def _handle(self, root):
+        """ Return a new handle on the version at root, or None if empty. """
+        if root is None:
+            return None
+        tree = self.__class__()
+        tree._root = root
+        return tree
+
+    def replace(self, obj):
+        """ Put obj in place of the element with the same sort_key(), as a
+        new version, and return that element (or None if there is none).
+        """
+        root, old = replace(self._root, obj)
+        self._root = root
+        return old
+
+    def find(self, key):
+        """ Return the element whose sort_key() == key, or None. """
+        node = self._root
+        while node is not None:
+            if key < node._key:
+                node = node._leftchild
+            elif key > node._key:
+                node = node._rightchild
+            else:
+                return node._element
+        return None
+
+    def search(self, searchitem):
+        """ Return the full string of the object matching searchitem, or None. """
+        element = self.find(searchitem.sort_key())
+        if element is None:
+            return None
+        return element.full_str()
+
+    def rank(self, key):
+        """ Return the number of elements ordered before key. """
+        rank = 0
+        node = self._root
+        while node is not None:
+            if key < node._key:
+                node = node._leftchild
+            elif key > node._key:
+                rank += 1 + _size(node._leftchild)
+                node = node._rightchild
+            else:
+                return rank + _size(node._leftchild)
+        return rank
+
+    def select(self, k):
+        """ Return the element at (0-based) in-order position k, or None. """
+        node = self._root
+        if k < 0 or k >= _size(node):
+            return None
+        while True:
+            leftsize = _size(node._leftchild)
+            if k < leftsize:
+                node = node._leftchild
+            elif k > leftsize:
+                k -= leftsize + 1
+                node = node._rightchild
+            else:
+                return node._element
+
+    def _properBST(self):
+        """ Return True if the ordering, sizes, heights and AVL balance of
+        the current version are all proper.
+        """
+        previous = None
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node._leftchild
+            node = stack.pop()
+            left = node._leftchild
+            right = node._rightchild
+            if node._size != 1 + _size(left) + _size(right):
+                return False
+            if node._height != 1 + max(_height(left), _height(right)):
+                return False
+            if abs(_height(left) - _height(right)) > 1:
+                return False
+            if previous is not None and not previous < node._key:
+                return False
+            previous = node._key
+            node = right
+        return True
+
+    def _test():
+        from bst import TestClass
+        tree = PersistentTree(TestClass("%04d" % 0))
+        for i in range(1, 1000):
+            tree.add(TestClass("%04d" % i))
+        before = tree.snapshot()
+        for i in range(0, 1000, 3):
+            tree.remove(TestClass("%04d" % i))
+        print('before:', before._stats(), '; proper BST:', before._properBST())
+        print('after:', tree._stats(), '; proper BST:', tree._properBST())
+
+        # readers walk pinned versions while one writer keeps changing it
+        failures = []
+        done = threading.Event()
+
+        def reader():
+            while not done.is_set():
+                snapshot = tree.snapshot()
+                keys = [item.sort_key() for item in snapshot]
+                if keys != sorted(keys) or len(keys) != snapshot.size():
+                    failures.append(keys)
+
+        readers = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in readers:
+            thread.start()
+        for i in range(2000):
+            if i % 2:
+                tree.remove(TestClass("%04d" % (i % 1000)))
+            else:
+                tree.add(TestClass("%04d" % (i % 1000)))
+        done.set()
+        for thread in readers:
+            thread.join()
+        print('concurrent readers saw torn versions:', len(failures))
+        return tree
+
+
+if __name__ == '__main__':
+    PersistentTree._test()
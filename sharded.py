@@ -0,0 +1,433 @@
+#author Karim Ulmann
+
+""" A movie catalogue sharded by title range across worker processes.
+
+Each worker process owns a MovieLib holding one contiguous range of titles,
+so several cores can answer queries at once.  Requests and replies travel
+over a pipe per worker as UTF-8 text, one tab-separated record per line:
+nothing is pickled, and Movies are rebuilt from their three fields at the
+receiving end.
+"""
+
+import datetime
+import multiprocessing
+import threading
+from bisect import bisect_right
+
+from movieLib import MOVIES, Movie, MovieLib, MovieReader, _date_ordinal, _minutes
+
+
+_NONE = '\x00'  # stands for None in a request (titles never contain it)
+
+
+def _field(value):
+    """ Return value as a request field.
+
+    Raises ValueError if it holds a tab or a line break (which no title in
+    a movie file can), as they would split the field.
+    """
+    if value is None:
+        return _NONE
+    field = str(value)
+    if '\t' in field or '\n' in field or '\r' in field or _NONE in field:
+        raise ValueError('a tab or line break cannot be sent: ' + repr(field))
+    return field
+
+
+def _unfield(field, convert=str):
+    """ Return the value of a request field, converted if not None. """
+    if field == _NONE:
+        return None
+    return convert(field)
+
+
+def _when(year):
+    """ Return a year argument (see MovieLib.lookup) as it is sent: an int
+    year stays one, and a full date goes as a 'dd/mm/yyyy' string.
+    """
+    if isinstance(year, datetime.date):
+        return year.strftime('%d/%m/%Y')
+    return year
+
+
+def _unwhen(field):
+    """ Return the year argument sent as field (see _when). """
+    if field.isdigit():
+        return int(field)
+    return field
+
+
+def _encode(movies):
+    """ Return the reply lines for movies: title, date ordinal and runtime,
+    with empty fields for unknown values.
+    """
+    return ''.join(['%s\t%s\t%s\n' % (movie._title,
+                                      '' if movie._date is None else movie._date,
+                                      '' if movie._time is None else movie._time)
+                    for movie in movies])
+
+
+def _decode(lines):
+    """ Return the Movies encoded in reply lines. """
+    movies = []
+    for line in lines:
+        title, date, runtime = line.split('\t')
+        movies.append(Movie(title, int(date) if date else None,
+                            int(runtime) if runtime else None))
+    return movies
+
+
+def _serve(conn, filename, lo, hi, options):
+    """ Run a worker: build a library of the titles in filename with
+    lo <= title < hi (either bound may be None), then answer requests on
+    conn until told to stop.
+
+    Each reply starts with a line giving the worker's numbers of titles and
+    of movies, followed by the lines of the movies in the answer; or, if
+    the request failed, is a single line: '!' and the error.
+    """
+    library = MovieLib.from_records(
+        [record for record in MovieReader(filename)
+         if (lo is None or record[0] >= lo) and (hi is None or record[0] < hi)],
+        **options)
+    while True:
+        fields = conn.recv_bytes().decode('utf-8').split('\t')
+        command = fields[0]
+        if command == 'stop':
+            conn.close()
+            return
+        try:
+            movies = _answer(library, command, fields[1:])
+        except Exception as error:
+            # tell the client, and carry on serving
+            message = '%s: %s' % (type(error).__name__, error)
+            reply = '!' + ' '.join(message.split()) + '\n'
+        else:
+            reply = '%d\t%d\n%s' % (library.titles(), library.size(),
+                                     _encode(movies))
+        conn.send_bytes(reply.encode('utf-8'))
+
+
+def _answer(library, command, args):
+    """ Return a list of the Movies answering a request to a worker. """
+    if command == 'lookup':
+        movie = library.lookup(args[0], _unfield(args[1], _unwhen))
+        return [movie] if movie is not None else []
+    if command == 'lookup_many':
+        return [movie for movie in library.lookup_many(args).values()
+                if movie is not None]
+    if command == 'editions':
+        return library.editions(args[0])
+    if command == 'range':
+        return list(library.range(_unfield(args[0]), _unfield(args[1])))
+    if command == 'prefix':
+        return list(library.prefix(args[0]))
+    if command == 'page':
+        return library.page(int(args[0]), int(args[1]))
+    if command == 'add':
+        movie = library.add(args[0], _unfield(args[1], int),
+                            _unfield(args[2], int))
+        return [movie] if movie is not None else []
+    if command == 'remove':
+        return library._remove(args[0], _unfield(args[1], _unwhen))
+    if command == 'count':
+        return []
+    raise ValueError('unknown request ' + repr(command))
+
+
+class ShardedCatalogue:
+    """ A movie catalogue split by title range across worker processes.
+
+    The distinct titles in the movie file are cut into workers ranges of
+    about the same number of titles, and a worker process builds and owns
+    the MovieLib for each range.  Lookups, adds and removes go to the one
+    worker whose range holds the title; range, prefix and page queries go
+    to every worker whose range they touch, all at once, and since the
+    ranges are in order the answers are merged by putting them end to end.
+
+    Any number of threads may use a catalogue: each worker's pipe has its
+    own lock, so requests to different workers proceed together.  A
+    request to several workers takes their locks in shard order, so two
+    such requests cannot deadlock.  A request that fails in a worker raises
+    RuntimeError, and the worker carries on.  Call close() (or use a with
+    block) to stop the workers.
+    """
+
+    def __init__(self, filename=MOVIES, workers=4, **options):
+        """ Start the workers.
+
+        Args:
+            filename - the movie file to serve
+            workers - the number of worker processes (shards)
+            options - passed on to MovieLib.from_records in each worker
+                (e.g. balanced=True)
+        """
+        titles = sorted({record[0] for record in MovieReader(filename)})
+        # the first title of every shard but the first
+        self._bounds = [titles[len(titles) * i // workers]
+                        for i in range(1, workers)]
+        limits = [None] + self._bounds + [None]
+        self._conns = []
+        self._locks = []
+        self._processes = []
+        for i in range(workers):
+            conn, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_serve, daemon=True,
+                args=(child, filename, limits[i], limits[i + 1], options))
+            process.start()
+            child.close()
+            self._conns.append(conn)
+            self._locks.append(threading.Lock())
+            self._processes.append(process)
+        # each shard's numbers of titles and of movies, as of its last reply
+        self._titles = [0] * workers
+        self._sizes = [0] * workers
+        self._scatter(range(workers), 'count')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """ Stop the workers. """
+        for i, conn in enumerate(self._conns):
+            with self._locks[i]:
+                if not conn.closed:
+                    try:
+                        conn.send_bytes(b'stop')
+                    except OSError:
+                        pass  # the worker has gone already
+                    conn.close()
+        for process in self._processes:
+            process.join()
+
+    def _shard(self, title):
+        """ Return the number of the shard whose range holds title. """
+        return bisect_right(self._bounds, title)
+
+    def _gather(self, requests):
+        """ Send each of requests, a list of (shard, command, args) in
+        shard order, all at once, and return a list of the Movies in the
+        replies, in order.
+
+        Every shard's reply is read before any error is raised, so no shard
+        is left locked or out of step with its pipe.
+
+        Raises ValueError (before sending anything) if an argument cannot
+        be sent (see _field), and RuntimeError if a shard failed to answer.
+        """
+        encoded = [(shard, '\t'.join([command] + [_field(arg) for arg in args]))
+                   for shard, command, args in requests]
+        sent = []
+        error = None
+        for shard, request in encoded:
+            # shard locks are always taken in shard order, so concurrent
+            # requests cannot deadlock; each is held until the reply is in
+            self._locks[shard].acquire()
+            try:
+                self._conns[shard].send_bytes(request.encode('utf-8'))
+            except OSError as failure:
+                self._locks[shard].release()
+                error = failure
+                break
+            sent.append(shard)
+        movies = []
+        for shard in sent:
+            try:
+                movies.extend(_decode(self._receive(shard)))
+            except (RuntimeError, OSError, EOFError) as failure:
+                error = error or failure
+        if error is not None:
+            raise error
+        return movies
+
+    def _receive(self, shard):
+        """ Return the reply lines from a shard, and release its lock. """
+        try:
+            reply = self._conns[shard].recv_bytes().decode('utf-8')
+        finally:
+            self._locks[shard].release()
+        # only '\n' ends a line: titles may hold other line breaks
+        lines = reply.split('\n')[:-1]
+        if lines[0].startswith('!'):
+            raise RuntimeError('shard %d: %s' % (shard, lines[0][1:]))
+        titles, size = lines[0].split('\t')
+        self._titles[shard] = int(titles)
+        self._sizes[shard] = int(size)
+        return lines[1:]
+
+    def _ask(self, shard, command, *args):
+        """ Return the Movies in a shard's reply to a request. """
+        return self._gather([(shard, command, args)])
+
+    def _scatter(self, shards, command, *args):
+        """ Send the same request to each of shards at once, and return a
+        list of the Movies in their replies, in shard order.
+        """
+        return self._gather([(shard, command, args) for shard in shards])
+
+    def _shards_between(self, lo, hi):
+        """ Return the shards whose ranges may hold titles with
+        lo <= title < hi (either bound may be None).
+        """
+        first = 0 if lo is None else self._shard(lo)
+        last = len(self._conns) - 1 if hi is None else self._shard(hi)
+        return range(first, last + 1)
+
+    def titles(self):
+        """ Return the number of distinct titles in the catalogue. """
+        return sum(self._titles)
+
+    def size(self):
+        """ Return the number of movies in the catalogue. """
+        return sum(self._sizes)
+
+    def lookup(self, title, year=None):
+        """ Return the Movie with matching title (see MovieLib.lookup), or
+        None.
+        """
+        movies = self._ask(self._shard(title), 'lookup', title, _when(year))
+        return movies[0] if movies else None
+
+    def search(self, title, year=None):
+        """ Return the full description of the movie with matching title,
+        or None.
+        """
+        movie = self.lookup(title, year)
+        if movie is None:
+            return None
+        return movie.full_str()
+
+    def editions(self, title):
+        """ Return a list of every Movie with matching title. """
+        return self._ask(self._shard(title), 'editions', title)
+
+    def lookup_many(self, titles):
+        """ Return a dict mapping each of titles to its (earliest) Movie, or
+        None; each shard looks up its own titles, all at once.
+        """
+        byshard = {}
+        for title in set(titles):
+            byshard.setdefault(self._shard(title), []).append(title)
+        found = dict.fromkeys(titles)
+        for movie in self._gather([(shard, 'lookup_many', byshard[shard])
+                                   for shard in sorted(byshard)]):
+            found[movie._title] = movie
+        return found
+
+    def range(self, lo=None, hi=None):
+        """ Return a list, in alphabetical order, of the movies with
+        lo <= title < hi; either bound may be None.
+        """
+        return self._scatter(self._shards_between(lo, hi), 'range', lo, hi)
+
+    def prefix(self, start):
+        """ Return a list, in alphabetical order, of the movies whose title
+        starts with start.
+        """
+        end = None
+        if start:
+            end = start[:-1] + chr(ord(start[-1]) + 1)
+        return self._scatter(self._shards_between(start, end), 'prefix', start)
+
+    def page(self, offset, limit):
+        """ Return a list of the Movies, in alphabetical order, with the
+        up to limit titles starting at (0-based) position offset in the
+        catalogue (see MovieLib.page).
+
+        The shard holding that position, and as many following shards as
+        are needed for limit titles, are all asked at once.
+        """
+        if limit <= 0 or offset < 0:
+            return []
+        shard = 0
+        while shard < len(self._titles) and offset >= self._titles[shard]:
+            offset -= self._titles[shard]
+            shard += 1
+        requests = []
+        wanted = limit
+        while shard < len(self._titles) and wanted > 0:
+            count = min(wanted, self._titles[shard] - offset)
+            requests.append((shard, 'page', (offset, count)))
+            wanted -= count
+            offset = 0
+            shard += 1
+        return self._gather(requests)
+
+    def add(self, title, date, runtime):
+        """ Add a new movie to the catalogue (see MovieLib.add).
+
+        Returns:
+            the movie that was added, or None if there already was a movie
+            with the same title and release date
+        """
+        movies = self._ask(self._shard(title), 'add', title,
+                           _date_ordinal(date), _minutes(runtime))
+        return movies[0] if movies else None
+
+    def remove(self, title, year=None):
+        """ Remove and return a movie with the given title, if there (see
+        MovieLib.remove).
+        """
+        movies = self._ask(self._shard(title), 'remove', title, _when(year))
+        return movies[0] if movies else None
+
+    def _test():
+        library = MovieLib.from_records(MovieReader(MOVIES), balanced=True)
+        with ShardedCatalogue(MOVIES, workers=3, balanced=True) as catalogue:
+            print('shards:', catalogue._titles, '; titles =', catalogue.titles(),
+                  '; size =', catalogue.size(),
+                  '; same as one library:',
+                  (catalogue.titles(), catalogue.size())
+                  == (library.titles(), library.size()))
+            bound = catalogue._bounds[0]
+            movies = catalogue.range(bound[:2], bound[:2] + 'zz')
+            print('range across a shard bound:',
+                  len(movies), movies == list(library.range(bound[:2],
+                                                            bound[:2] + 'zz')))
+            print('prefix "The ":', len(catalogue.prefix('The ')),
+                  catalogue.prefix('The ') == list(library.prefix('The ')))
+            offset = catalogue._titles[0] - 5
+            print('page across a shard bound:',
+                  catalogue.page(offset, 20) == library.page(offset, 20))
+            paged = []
+            for offset in range(0, catalogue.titles(), 1000):
+                paged.extend(catalogue.page(offset, 1000))
+            print('paged through in thousands:',
+                  [movie.full_str() for movie in paged]
+                  == [movie.full_str() for movie in library])
+            titles = [movie.get_title() for movie in library.page(0, 1000)][::7]
+            print('lookup_many:',
+                  catalogue.lookup_many(titles + ['no such film'])
+                  == library.lookup_many(titles + ['no such film']))
+            print('lookup:', catalogue.search(titles[1]) == library.search(titles[1]))
+            usher = 'The Fall of the House of Usher'
+            print('by year and by date:', catalogue.search(usher, 1928), ';',
+                  catalogue.search(usher, datetime.date(1928, 12, 31)))
+            added = catalogue.add('Zzz sharded test', '01/02/2003', '95')
+            print('add:', added.full_str(),
+                  catalogue.lookup('Zzz sharded test') == added,
+                  '; remove:', catalogue.remove('Zzz sharded test') == added,
+                  catalogue.lookup('Zzz sharded test'),
+                  '; size back to', catalogue.size())
+            try:
+                catalogue.lookup('Bad\ttitle')
+            except ValueError as error:
+                print('tab in a title:', error)
+            try:
+                catalogue._ask(0, 'page', 'not a number', 1)
+            except RuntimeError as error:
+                print('failed request:', error)
+            odd = 'Line\x85separated\u2028title'
+            catalogue.add(odd, None, 90)
+            print('still serving:', catalogue.search(titles[1]) is not None,
+                  '; odd line breaks kept:', catalogue.lookup(odd).get_title() == odd,
+                  '; range over them:', len(catalogue.range('Line', 'Linf')))
+        return catalogue
+
+
+if __name__ == '__main__':
+    ShardedCatalogue._test()
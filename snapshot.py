@@ -0,0 +1,262 @@
+#author Karim Ulmann
+
+""" A compact, versioned binary snapshot format for movie catalogues.
+
+A snapshot file holds, all little-endian:
+
+    header      magic b'PYFLIXSN', version (u32), count (u32), records (u32)
+    offsets     count + 1 u32 byte offsets into the title data
+    firsts      count + 1 u32 indexes of each title's first record
+    dates       records i32 date ordinals (0 if unknown)
+    runtimes    records i32 running times in minutes (-1 if unknown)
+    titles      the UTF-8 encoded titles, in sorted order, back to back
+
+A title may have several records (re-releases, remakes): those of title i
+are records firsts[i] up to firsts[i + 1].
+
+Since UTF-8 preserves code point order, the encoded titles sort exactly as
+the str titles do, so a mapped snapshot can be binary searched on raw bytes.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from math import ceil, log2
+
+
+MAGIC = b'PYFLIXSN'
+VERSION = 2
+_HEADER = struct.Struct('<8sIII')
+
+
+def is_snapshot(path):
+    """ Return True if the file at path starts like a snapshot. """
+    with open(path, 'rb') as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def write_snapshot(path, records):
+    """ Write a snapshot of records to path.
+
+    Args:
+        path - the file to write
+        records - a list of (title, editions) tuples in strictly increasing
+            title order, where editions is a list of (date ordinal or None,
+            runtime or None) tuples
+    """
+    count = len(records)
+    offsets = array('I', [0])
+    firsts = array('I', [0])
+    dates = array('i')
+    runtimes = array('i')
+    titles = []
+    end = 0
+    for title, editions in records:
+        encoded = title.encode('utf-8')
+        titles.append(encoded)
+        end += len(encoded)
+        offsets.append(end)
+        for date, runtime in editions:
+            dates.append(0 if date is None else date)
+            runtimes.append(-1 if runtime is None else runtime)
+        firsts.append(len(dates))
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+        firsts.byteswap()
+        dates.byteswap()
+        runtimes.byteswap()
+    with open(path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, VERSION, count, len(dates)))
+        file.write(offsets.tobytes())
+        file.write(firsts.tobytes())
+        file.write(dates.tobytes())
+        file.write(runtimes.tobytes())
+        file.write(b''.join(titles))
+
+
+def _column(buffer, typecode, start, count):
+    """ Return an indexable view of count values of typecode at start. """
+    view = memoryview(buffer)[start:start + 4 * count].cast(typecode)
+    if sys.byteorder != 'little':
+        column = array(typecode, view)
+        column.byteswap()
+        return column
+    return view
+
+
+class SnapshotTree:
+    """ A read-only catalogue tree backed by a memory-mapped snapshot.
+
+    Nothing is decoded up front: lookups binary search the mapped title
+    data, and items are only built (with make_item) for the results
+    returned, so loading costs the same whatever the catalogue size and the
+    mapped pages are shared between processes through the page cache.
+
+    It offers the read methods of the BSTNode at the root of a tree, with
+    positions in the sorted title table standing in for nodes.  It cannot
+    be modified: MovieLib copies it into an ordinary tree first.
+    """
+
+    def __init__(self, path, make_item):
+        """ Map the snapshot at path.
+
+        Args:
+            path - the snapshot file
+            make_item - called as make_item(title, editions) to build each
+                item returned, where editions is a list of (date, runtime)
+                tuples; date and runtime may be None
+
+        Raises ValueError if the file is not a snapshot of this version.
+        """
+        with open(path, 'rb') as file:
+            if file.seek(0, 2) < _HEADER.size:
+                raise ValueError(path + ' is not a movie snapshot')
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from('<8sI', self._map)
+        if magic != MAGIC:
+            raise ValueError(path + ' is not a movie snapshot')
+        if version != VERSION:
+            raise ValueError('unsupported snapshot version ' + str(version))
+        count, records = _HEADER.unpack_from(self._map)[2:]
+        start = _HEADER.size
+        self._count = count
+        self._records = records
+        self._offsets = _column(self._map, 'I', start, count + 1)
+        start += 4 * (count + 1)
+        self._firsts = _column(self._map, 'I', start, count + 1)
+        start += 4 * (count + 1)
+        self._dates = _column(self._map, 'i', start, records)
+        start += 4 * records
+        self._runtimes = _column(self._map, 'i', start, records)
+        self._titles = start + 4 * records
+        self._make_item = make_item
+
+    def _title_bytes(self, i):
+        """ Return the encoded title at position i. """
+        return self._map[self._titles + self._offsets[i]:
+                         self._titles + self._offsets[i + 1]]
+
+    def _item(self, i):
+        """ Build and return the item at position i. """
+        editions = []
+        for j in range(self._firsts[i], self._firsts[i + 1]):
+            date = self._dates[j]
+            runtime = self._runtimes[j]
+            editions.append((date if date != 0 else None,
+                             runtime if runtime != -1 else None))
+        return self._make_item(self._title_bytes(i).decode('utf-8'), editions)
+
+    def _bisect(self, key, lo=0):
+        """ Return the first position from lo on whose title is not before
+        key.
+        """
+        encoded = key.encode('utf-8')
+        hi = self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._title_bytes(mid) < encoded:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def __str__(self):
+        """ Return a string representation of the tree, in order. """
+        return ''.join([' ' + str(element) + ',' for element in self])
+
+    def __iter__(self):
+        """ Yield the items, in order. """
+        return self.elements_from(0)
+
+    def root(self):
+        """ Return the tree itself (it is its own root). """
+        return self
+
+    def size(self):
+        """ Return the number of items. """
+        return self._count
+
+    def record_count(self):
+        """ Return the number of records, over all the items. """
+        return self._records
+
+    def height(self):
+        """ Return the height of the implicit binary search tree. """
+        if self._count == 0:
+            return -1
+        return ceil(log2(self._count + 1)) - 1
+
+    def _stats(self):
+        """ Return the basic stats on the tree. """
+        return ('size = ' + str(self.size())
+                + '; height = ' + str(self.height()))
+
+    def find_node(self, key):
+        """ Return the position of the item with sort_key() == key, or None. """
+        i = self._bisect(key)
+        if i < self._count and self._title_bytes(i) == key.encode('utf-8'):
+            return i
+        return None
+
+    def find(self, key):
+        """ Return the item whose sort_key() == key, or None. """
+        i = self.find_node(key)
+        if i is None:
+            return None
+        return self._item(i)
+
+    def find_many(self, keys):
+        """ Return a list of the items matching each of the sorted, distinct
+        keys (None where there is no match).
+
+        Each binary search starts where the previous one ended.
+        """
+        results = []
+        lo = 0
+        for key in keys:
+            lo = self._bisect(key, lo)
+            if lo < self._count and self._title_bytes(lo) == key.encode('utf-8'):
+                results.append(self._item(lo))
+            else:
+                results.append(None)
+        return results
+
+    def search(self, searchitem):
+        """ Return the full string of the object matching searchitem, or None. """
+        item = self.find(searchitem.sort_key())
+        if item is None:
+            return None
+        return item.full_str()
+
+    def rank(self, key):
+        """ Return the number of items ordered before key. """
+        return self._bisect(key)
+
+    def select(self, k):
+        """ Return the item at (0-based) position k, or None. """
+        if k < 0 or k >= self._count:
+            return None
+        return self._item(k)
+
+    def elements_from(self, k):
+        """ Yield the items in order, starting from (0-based) position k. """
+        if k < 0:
+            return
+        for i in range(k, self._count):
+            yield self._item(i)
+
+    def range(self, lo=None, hi=None):
+        """ Yield, in order, the items whose sort_key() k has lo <= k < hi. """
+        start = 0 if lo is None else self._bisect(lo)
+        end = self._count if hi is None else self._bisect(hi)
+        for i in range(start, end):
+            yield self._item(i)
+
+    def prefix(self, start):
+        """ Yield, in order, the items whose sort_key() starts with start. """
+        encoded = start.encode('utf-8')
+        for i in range(self._bisect(start), self._count):
+            if not self._title_bytes(i).startswith(encoded):
+                return
+            yield self._item(i)
@@ -0,0 +1,257 @@
+#author Karim Ulmann
+
+""" A movie library that many threads can share. """
+
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from movieLib import MOVIES, MovieLib, MovieReader
+
+
+class RWLock:
+    """ A readers-writer lock.
+
+    Any number of threads may hold it for reading at once, or one thread
+    for writing.  Waiting writers go ahead of new readers, so a steady
+    stream of searches cannot starve the writer.  A thread that already
+    holds the lock (either way) may take it again, for reading or for
+    writing if it is the writer, without blocking; a reader may not
+    upgrade to writing.
+    """
+
+    def __init__(self):
+        """ Initialise an unheld lock. """
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._waiting_writers = 0
+        self._held = threading.local()
+
+    def _depth(self):
+        """ Return how many times the current thread holds the lock. """
+        return getattr(self._held, 'depth', 0)
+
+    @contextmanager
+    def read(self):
+        """ Hold the lock for reading for the duration of a with block. """
+        depth = self._depth()
+        if depth == 0:
+            with self._cond:
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+                self._readers += 1
+        self._held.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._held.depth = depth
+            if depth == 0:
+                with self._cond:
+                    self._readers -= 1
+                    if self._readers == 0:
+                        self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        """ Hold the lock for writing for the duration of a with block. """
+        depth = self._depth()
+        me = threading.get_ident()
+        if depth == 0:
+            with self._cond:
+                self._waiting_writers += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._waiting_writers -= 1
+                self._writer = me
+        elif self._writer != me:
+            raise RuntimeError('cannot upgrade a read lock to a write lock')
+        self._held.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._held.depth = depth
+            if depth == 0:
+                with self._cond:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+class SharedMovieLib(MovieLib):
+    """ A MovieLib that is safe to share between threads.
+
+    Queries hold a readers-writer lock for reading, so they run alongside
+    one another, and changes hold it for writing.  apply_batch makes a
+    whole batch of changes under a single write acquisition.  The
+    iterators (iteration, range, prefix, diff and the secondary index
+    queries) collect their results under the lock and then yield from
+    that list, so a slow consumer never keeps writers waiting.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """ Initialise a shared movie library; see MovieLib() for the
+        arguments.
+        """
+        MovieLib.__init__(self, *args, **kwargs)
+        self._lock = RWLock()
+
+    def add(self, title, date, runtime):
+        with self._lock.write():
+            return MovieLib.add(self, title, date, runtime)
+
+    def remove(self, title, year=None):
+        with self._lock.write():
+            return MovieLib.remove(self, title, year)
+
+    def apply_batch(self, adds=(), removes=()):
+        with self._lock.write():
+            return MovieLib.apply_batch(self, adds, removes)
+
+    def apply_delta(self, stream):
+        with self._lock.write():
+            return MovieLib.apply_delta(self, stream)
+
+    def remove_range(self, lo=None, hi=None):
+        with self._lock.write():
+            return MovieLib.remove_range(self, lo, hi)
+
+    def split(self, title):
+        with self._lock.write():
+            return MovieLib.split(self, title)
+
+    @classmethod
+    def join(cls, left, right):
+        # take the two locks in a fixed order, so two joins cannot deadlock
+        first, second = sorted((left, right), key=id)
+        with first._lock.write(), second._lock.write():
+            return MovieLib.join(left, right)
+
+    def lookup(self, title, year=None):
+        with self._lock.read():
+            return MovieLib.lookup(self, title, year)
+
+    def editions(self, title):
+        with self._lock.read():
+            return MovieLib.editions(self, title)
+
+    def lookup_many(self, titles):
+        with self._lock.read():
+            return MovieLib.lookup_many(self, titles)
+
+    def search_many(self, titles):
+        with self._lock.read():
+            return MovieLib.search_many(self, titles)
+
+    def search(self, title, year=None):
+        with self._lock.read():
+            return MovieLib.search(self, title, year)
+
+    def size(self):
+        with self._lock.read():
+            return MovieLib.size(self)
+
+    def titles(self):
+        with self._lock.read():
+            return MovieLib.titles(self)
+
+    def height(self):
+        with self._lock.read():
+            return MovieLib.height(self)
+
+    def rank(self, title):
+        with self._lock.read():
+            return MovieLib.rank(self, title)
+
+    def select(self, k):
+        with self._lock.read():
+            return MovieLib.select(self, k)
+
+    def page(self, offset, limit):
+        with self._lock.read():
+            return MovieLib.page(self, offset, limit)
+
+    def __str__(self):
+        with self._lock.read():
+            return MovieLib.__str__(self)
+
+    def __iter__(self):
+        with self._lock.read():
+            return iter(list(MovieLib.__iter__(self)))
+
+    def range(self, lo=None, hi=None):
+        with self._lock.read():
+            return iter(list(MovieLib.range(self, lo, hi)))
+
+    def prefix(self, start):
+        with self._lock.read():
+            return iter(list(MovieLib.prefix(self, start)))
+
+    def released_between(self, first=None, last=None):
+        with self._lock.read():
+            return iter(list(MovieLib.released_between(self, first, last)))
+
+    def runtime_between(self, shortest=None, longest=None):
+        with self._lock.read():
+            return iter(list(MovieLib.runtime_between(self, shortest, longest)))
+
+    def diff(self, other):
+        with self._lock.read():
+            return iter(list(MovieLib.diff(self, other)))
+
+    def snapshot(self):
+        with self._lock.read():
+            return MovieLib.snapshot(self)
+
+    def save(self, path):
+        with self._lock.read():
+            return MovieLib.save(self, path)
+
+    def _test():
+        library = SharedMovieLib(balanced=True)
+        library.apply_batch(adds=[(str(i), None, i) for i in range(1000)])
+        failures = []
+
+        def reader(start):
+            for i in range(start, start + 2000):
+                title = str(i % 1000)
+                movie = library.lookup(title)
+                if movie is not None and movie.get_title() != title:
+                    failures.append(title)
+
+        def writer():
+            for i in range(0, 1000, 2):
+                library.apply_batch(adds=[(str(i + 1000), None, 1)],
+                                    removes=[str(i)])
+
+        threads = [threading.Thread(target=reader, args=(i * 100,))
+                   for i in range(4)]
+        threads.append(threading.Thread(target=writer))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(library.bst._stats(), '; proper BST:', library.bst._properBST(),
+              '; bad lookups:', len(failures))
+
+        path = os.path.join(tempfile.gettempdir(), 'shared_movies.snap')
+        MovieLib.from_records(MovieReader(MOVIES)).save(path)
+        loaded = SharedMovieLib.load(path, hashed=True)
+        misses = []
+
+        def hashed_reader():
+            for i in range(200):
+                if loaded.lookup('Zulu') is None:
+                    misses.append(i)
+
+        threads = [threading.Thread(target=hashed_reader) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print('hashed lookups from 8 threads after load, misses:', len(misses))
+        return library
+
+
+if __name__ == '__main__':
+    SharedMovieLib._test()
@@ -0,0 +1,172 @@
+#author Karim Ulmann
+
+""" The ordered walks shared by the tree classes.
+
+BSTNode, ArrayBST and PersistentTree lay their nodes out differently
+(linked objects, slots in parallel arrays, immutable shared nodes), but
+walk them the same way.  TreeWalks holds those walks once; each class
+says how to get from a node to its children, key, element and subtree
+size by returning a set of accessors from _walk.
+"""
+
+from operator import attrgetter
+
+
+class TreeWalks:
+    """ Mixin of the in-order queries (iteration, range, prefix,
+    elements_from and find_many) for a tree class that supplies _walk.
+    """
+
+    __slots__ = ()
+
+    def _walk(self):
+        """ Return (root, nil, left, right, key, element, size): the node to
+        walk from, the value standing for no node, and functions giving a
+        node's left and right child, sort key and element, and the size of
+        the subtree at a node (0 for nil).
+        """
+        raise NotImplementedError
+
+    def __str__(self):
+        """ Return a string representation of the tree.
+
+        The string will be created by an in-order traversal.
+        """
+        return ''.join([' ' + str(element) + ',' for element in self])
+
+    def __iter__(self):
+        """ Yield the elements of the tree, in order.
+
+        Walks the tree lazily with an explicit stack, not recursion.
+        """
+        return self.range()
+
+    def _stats(self):
+        """ Return the basic stats on the tree. """
+        return ('size = ' + str(self.size())
+                + '; height = ' + str(self.height()))
+
+    def range(self, lo=None, hi=None):
+        """ Yield, in order, the elements whose sort_key() k has lo <= k < hi.
+
+        Either bound may be None to leave that end open.  Subtrees that lie
+        wholly below lo are never entered, and the walk stops at the first
+        key at or above hi, so only the matching nodes (plus one path down
+        the tree) are visited.
+        """
+        node, nil, left, right, key, element, size = self._walk()
+        stack = []
+        while True:
+            while node != nil:
+                if lo is not None and key(node) < lo:
+                    node = right(node)
+                else:
+                    stack.append(node)
+                    node = left(node)
+            if not stack:
+                return
+            node = stack.pop()
+            if hi is not None and not key(node) < hi:
+                return
+            yield element(node)
+            node = right(node)
+
+    def prefix(self, start):
+        """ Yield, in order, the elements whose sort_key() starts with start.
+
+        The keys must be strings.
+        """
+        for element in self.range(start):
+            if not element.sort_key().startswith(start):
+                return
+            yield element
+
+    def elements_from(self, k):
+        """ Yield the elements in order, starting from (0-based) in-order
+        position k.
+
+        Finding position k costs one descent; each further element is then
+        a step of an ordinary in-order walk.
+        """
+        if k < 0:
+            return
+        node, nil, left, right, key, element, size = self._walk()
+        stack = []
+        while node != nil:
+            leftsize = size(left(node))
+            if k < leftsize:
+                stack.append(node)
+                node = left(node)
+            elif k > leftsize:
+                k -= leftsize + 1
+                node = right(node)
+            else:
+                stack.append(node)
+                break
+        while stack:
+            node = stack.pop()
+            yield element(node)
+            node = right(node)
+            while node != nil:
+                stack.append(node)
+                node = left(node)
+
+    def find_many(self, keys):
+        """ Return a list of the elements matching each of keys (None where
+        there is no match).
+
+        Args:
+            keys: a sorted list of distinct keys
+
+        A finger search: each key is looked for from where the one before
+        it was found, not from the root.  The walk keeps a stack of the
+        nodes it went left at, as an in-order walk does, and only climbs
+        as far up that stack as the next key needs before going down
+        again.  So keys close together cost a few steps each, and a batch
+        of k keys costs O(k log(n/k)) steps in all rather than O(k log n).
+        """
+        node, nil, left, right, key, element, size = self._walk()
+        results = []
+        stack = []  # ancestors to the right of node, nearest on top
+        for wanted in keys:
+            found = None
+            # climb to the subtree holding the keys from wanted up to the
+            # nearest ancestor still to the right of it
+            while stack:
+                top = stack[-1]
+                topkey = key(top)
+                if wanted < topkey:
+                    break
+                stack.pop()
+                node = right(top)
+                if topkey == wanted:
+                    found = top
+                    break
+            if found is None:
+                while node != nil:
+                    nodekey = key(node)
+                    if nodekey < wanted:
+                        node = right(node)
+                    elif wanted < nodekey:
+                        stack.append(node)
+                        node = left(node)
+                    else:
+                        found = node
+                        node = right(node)
+                        break
+            results.append(None if found is None else element(found))
+        return results
+
+
+_left = attrgetter('_leftchild')
+_right = attrgetter('_rightchild')
+_key = attrgetter('_key')
+_element = attrgetter('_element')
+
+
+def linked(root, size):
+    """ Return the accessors for _walk over a tree of linked nodes (with
+    _leftchild, _rightchild, _key and _element attributes, None for no
+    node) from root, where size(node) gives the size of a subtree.
+    """
+    return (root, None, _left, _right, _key, _element, size)